@@ -1,34 +1,58 @@
 from fastapi import (
     FastAPI,
-    UploadFile,
-    File,
     HTTPException,
     Depends,
+    Query,
+    Request,
 )
 from job_storage.mongo_init import jobs_collection
+from job_storage import job_scheduler, job_signals
+from job_storage.job_signals import notify_job_enqueued
 
-from fastapi.responses import RedirectResponse
-from typing import List
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
+import asyncio
+import json
+import os
 from fastapi.middleware.cors import CORSMiddleware
-from supabase_client.supabase_init import supabase_public
+from supabase_client.supabase_init import close_async_clients
 from supabase_client.auth import signup, signin, signout
-from supabase_client.storage_operations import upload_images_and_manifest, create_signed_report_url
+from supabase_client.storage_operations import BatchUploader, create_signed_report_url
 from supabase_client.db_operations import (
     insert_job,
     delete_job,
-    returning_all_jobs
+    get_user_job,
+    list_user_jobs,
+    JOB_FIELDS,
+    JOB_STATUSES
 )
-from schema import AuthPayload, JobCreateResponse
+from schema import AuthPayload, JobCreateResponse, JobListResponse
 from auth_dependency import get_current_user
-from workers.worker import run_worker
+from ingestion import stream_uploaded_images
+import metrics
 # ---------------- App ----------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Job events from workers in other processes reach /events through this
+    tailer = job_signals.start_tailer()
+    yield
+    if tailer:
+        tailer.cancel()
+    # Async Supabase clients share one pooled HTTP client; close it cleanly
+    await close_async_clients()
+
+
 app = FastAPI(
     title="AI Image Detection API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -39,117 +63,177 @@ app.add_middleware(
 
 async def enqueue_job(job_data: dict):
     await jobs_collection.insert_one(job_data)
+    await notify_job_enqueued(job_data["job_id"])
 
 
 # ---------------- Constants ----------------
 BUCKET = "user-uploads"
-MAX_IMAGES = 100
+MAX_IMAGES = int(os.getenv("MAX_IMAGES", "500"))
 MAX_IMAGE_SIZE_MB = 5
 
+# Job event streams send a comment this often so proxies keep them open
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+FINAL_STATUSES = ("DONE", "FAILED")
+
+# GET /jobs page size
+JOBS_PAGE_SIZE = int(os.getenv("JOBS_PAGE_SIZE", "20"))
+JOBS_MAX_PAGE_SIZE = int(os.getenv("JOBS_MAX_PAGE_SIZE", "100"))
+
+# Requests larger than this are rejected from Content-Length alone
+MAX_REQUEST_BYTES = (MAX_IMAGES * MAX_IMAGE_SIZE_MB + 1) * 1024 * 1024
+
+# Request body schema for /docs (the body is parsed by hand while streaming)
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["images"],
+                    "properties": {
+                        "images": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"}
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
 
 # ============================================================
 # Health
 # ============================================================
 
 @app.get("/health")
-def health():
+async def health():
         return {
         "status": "ok",
         "timestamp": datetime.utcnow().isoformat()
         }
     
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_api():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+
 # ============================================================
 # Auth APIs
 # ============================================================
 
 @app.post("/auth/signup")
-def signup_api(payload: AuthPayload):
-    return signup(
+async def signup_api(payload: AuthPayload):
+    return await signup(
          payload.email,
          payload.password
     )
 
 
 @app.post("/auth/signin")
-def signin_api(payload: AuthPayload):
-    return signin(
+async def signin_api(payload: AuthPayload):
+    return await signin(
         payload.email,
         payload.password
     )
 
 
 @app.post("/auth/signout")
-def signout_api():
-    return signout()
+async def signout_api():
+    return await signout()
 
 # ============================================================
 # Create Job
 # ============================================================
 
-@app.post("/jobs", response_model=JobCreateResponse)
+@app.post("/jobs", response_model=JobCreateResponse, openapi_extra=UPLOAD_OPENAPI)
 async def create_job(
-    images: List[UploadFile] = File(...),
+    request: Request,
     user=Depends(get_current_user)
 ):
-    if not images:
-        raise HTTPException(status_code=400, detail="No images provided")
-
-    if len(images) > MAX_IMAGES:
-        raise HTTPException(status_code=400, detail="Too many images")
+    content_length = request.headers.get("content-length")
+    if content_length:
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
 
-    image_payload = []
-
-    for img in images:
-        content = await img.read()
-        size_mb = len(content) / (1024 * 1024)
-
-        if size_mb > MAX_IMAGE_SIZE_MB:
-            raise HTTPException(
-                status_code=400,
-                detail=f"{img.filename} exceeds {MAX_IMAGE_SIZE_MB}MB"
-            )
-
-        image_payload.append((img.filename, content))
+        if content_length > MAX_REQUEST_BYTES:
+            raise HTTPException(status_code=413, detail="Upload too large")
 
     # ---------------- Create Job ----------------
-    job_id = insert_job(user_id=user["user_id"], status="QUEUED")
+    job_id = await insert_job(user_id=user["user_id"], status="QUEUED")
 
     base_path = f"users/{user['user_id']}/jobs/{job_id}"
     input_prefix = f"{base_path}/input"
     manifest_path = f"{base_path}/manifest.json"
     report_prefix = f"{base_path}/report"
 
-    manifest = {
-        "job_id": job_id,
-        "user_id": user["user_id"],
-        "images": [name for name, _ in image_payload],
-        "total_images": len(image_payload),
-        "created_at": datetime.utcnow().isoformat()
-    }
+    # ---------------- Stream Images → Storage ----------------
+    # Each image starts uploading as soon as its part has been received;
+    # at most UPLOAD_CONCURRENCY images are buffered per request.
+    filenames = []
+    uploader = BatchUploader(BUCKET)
+
+    try:
+        async for filename, content_type, content in stream_uploaded_images(
+            request,
+            max_files=MAX_IMAGES,
+            max_file_bytes=MAX_IMAGE_SIZE_MB * 1024 * 1024
+        ):
+            await uploader.submit(
+                remote_path=f"{input_prefix}/{filename}",
+                content=content,
+                content_type=content_type
+            )
+            filenames.append(filename)
 
-    upload_images_and_manifest(
-        bucket=BUCKET,
-        images=image_payload,
-        manifest=manifest,
-        manifest_remote_path=manifest_path,
-        input_prefix=input_prefix
-    )
+        if not filenames:
+            raise HTTPException(status_code=400, detail="No images provided")
 
-    # ---------------- Enqueue Job (MongoDB) ----------------
-    payload = {
-        "job_id": job_id,
-        "user_id": user["user_id"],
-        "user_email": user["email"],
-        "bucket": BUCKET,
-        "input_prefix": f"{input_prefix}/",
-        "manifest_path": manifest_path,
-        "report_prefix": f"{report_prefix}/",
-        "report_filename": "ai_image_report.pdf",
-        "created_at": datetime.utcnow().isoformat()
-    }
+        manifest = {
+            "job_id": job_id,
+            "user_id": user["user_id"],
+            "images": filenames,
+            "total_images": len(filenames),
+            "created_at": datetime.utcnow().isoformat()
+        }
+
+        # Manifest is written only after every image upload succeeded
+        await uploader.commit(
+            manifest=manifest,
+            manifest_remote_path=manifest_path
+        )
+
+        # ---------------- Enqueue Job (MongoDB) ----------------
+        payload = {
+            "job_id": job_id,
+            "user_id": user["user_id"],
+            "user_email": user["email"],
+            "bucket": BUCKET,
+            "input_prefix": f"{input_prefix}/",
+            "manifest_path": manifest_path,
+            "report_prefix": f"{report_prefix}/",
+            "report_filename": "ai_image_report.pdf",
+            "created_at": datetime.utcnow().isoformat(),
+            # total_images, lane, schedule_key
+            **await job_scheduler.schedule_fields(user["user_id"], len(filenames))
+        }
 
-    await enqueue_job(payload)
+        await enqueue_job(payload)
+
+    except Exception:
+        # Don't leave a half-uploaded or never-queued job behind
+        try:
+            await uploader.rollback()
+            await delete_job(job_id)
+        except Exception as cleanup_error:
+            print(f"⚠️ Cleanup of job {job_id} failed: {cleanup_error}")
+        raise
 
     return JobCreateResponse(job_id=job_id, status="QUEUED")
 
@@ -157,53 +241,129 @@ async def create_job(
 # List Jobs
 # ============================================================
 
-@app.get("/jobs")
-def list_jobs(user=Depends(get_current_user)):
-    return returning_all_jobs(user["user_id"])
+def _csv_param(value: Optional[str], allowed, name: str):
+    if not value:
+        return None
+
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown {name}: {', '.join(unknown)}")
+
+    return items
+
+
+@app.get("/jobs", response_model=JobListResponse)
+async def list_jobs(
+    user=Depends(get_current_user),
+    limit: int = Query(JOBS_PAGE_SIZE, ge=1, le=JOBS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of {', '.join(JOB_FIELDS)}"),
+    status: Optional[str] = Query(None, description=f"Comma-separated subset of {', '.join(JOB_STATUSES)}"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+):
+    """
+    Newest jobs first. Pass next_cursor back as cursor for the next page.
+    """
+    try:
+        jobs, next_cursor = await list_user_jobs(
+            user["user_id"],
+            limit=limit,
+            cursor=cursor,
+            fields=_csv_param(fields, JOB_FIELDS, "fields") or JOB_FIELDS,
+            statuses=_csv_param(status, JOB_STATUSES, "status"),
+            created_after=created_after,
+            created_before=created_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return JobListResponse(jobs=jobs, next_cursor=next_cursor)
 
 # ============================================================
 # Job Status
 # ============================================================
 
 @app.get("/jobs/{job_id}")
-def get_job(job_id: str, user=Depends(get_current_user)):
-    job = (
-        supabase_public
-        .table("jobs")
-        .select("*")
-        .eq("job_id", job_id)
-        .eq("user_id", user["user_id"])
-        .single()
-        .execute()
-    )
+async def get_job(job_id: str, user=Depends(get_current_user)):
+    job = await get_user_job(job_id, user["user_id"])
 
-    if not job.data:
+    if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return job.data
+    return job
+
+# ============================================================
+# Job Events (Server-Sent Events)
+# ============================================================
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, user=Depends(get_current_user)):
+    """
+    Streams `status` events (QUEUED / PROGRESSED / DONE / FAILED) and
+    `progress` events ({done, total} images) until the job finishes.
+    """
+    # Subscribe before reading the row so no transition is missed
+    queue = job_signals.subscribe(job_id)
+
+    try:
+        job = await get_user_job(job_id, user["user_id"])
+    except BaseException:
+        job_signals.unsubscribe(job_id, queue)
+        raise
+
+    if not job:
+        job_signals.unsubscribe(job_id, queue)
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        try:
+            yield _sse("status", {"job_id": job_id, "status": job["status"], "report_path": job.get("report_path")})
+            if job["status"] in FINAL_STATUSES:
+                return
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event["type"] == job_signals.JOB_PROGRESS:
+                    yield _sse("progress", {"job_id": job_id, "done": event["done"], "total": event["total"]})
+                    continue
+
+                yield _sse("status", {"job_id": job_id, "status": event["status"], "report_path": event.get("report_path")})
+                if event["status"] in FINAL_STATUSES:
+                    return
+        finally:
+            job_signals.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ============================================================
 # Download Report (auto-download)
 # ============================================================
 
 @app.get("/jobs/{job_id}/report")
-def download_report(job_id: str, user=Depends(get_current_user)):
-    job = (
-        supabase_public
-        .table("jobs")
-        .select("report_path")
-        .eq("job_id", job_id)
-        .eq("user_id", user["user_id"])
-        .single()
-        .execute()
-    )
+async def download_report(job_id: str, user=Depends(get_current_user)):
+    job = await get_user_job(job_id, user["user_id"], columns="report_path")
 
-    if not job.data or not job.data["report_path"]:
+    if not job or not job["report_path"]:
         raise HTTPException(status_code=404, detail="Report not ready")
 
-    signed_url = create_signed_report_url(
+    signed_url = await create_signed_report_url(
         bucket=BUCKET,
-        report_path=job.data["report_path"]
+        report_path=job["report_path"]
     )
 
     return RedirectResponse(url=signed_url)
@@ -213,29 +373,25 @@ def download_report(job_id: str, user=Depends(get_current_user)):
 # ============================================================
 
 @app.delete("/jobs/{job_id}")
-def delete_job_api(job_id: str, user=Depends(get_current_user)):
-    job = (
-        supabase_public
-        .table("jobs")
-        .select("job_id")
-        .eq("job_id", job_id)
-        .eq("user_id", user["user_id"])
-        .single()
-        .execute()
-    )
+async def delete_job_api(job_id: str, user=Depends(get_current_user)):
+    job = await get_user_job(job_id, user["user_id"], columns="job_id")
 
-    if not job.data:
+    if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    delete_job(job_id)
+    await delete_job(job_id)
 
 @app.post("/internal/run-worker")
 async def run_worker_once():
     """
     Manually triggers the worker once.
     Blocking call. For testing only.
+    Returns once the queue has been idle for WORKER_MAX_IDLE_SECONDS.
     """
-    await run_worker()
+    # Imported here so API processes never load onnxruntime, ReportLab or the model
+    from workers.worker import run_worker
+
+    await run_worker(idle_policy="exit")
 
     return {
         "status": "finished",
@@ -1,16 +1,91 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from typing import Optional
+
+import jwt
+from cachetools import TTLCache
 from fastapi import (
     HTTPException,
     Header,
 )
-from supabase_client.supabase_init import supabase_public
+from supabase_client.supabase_init import SUPABASE_URL, get_async_public
 
+# ---------- CONFIG ----------
+# Legacy projects sign access tokens with HS256 and this shared secret
+JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 
-def get_current_user(authorization: str = Header(...)):
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid Authorization header")
+# Projects using asymmetric signing keys publish them here
+JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json"
+JWKS_CACHE_SECONDS = int(os.getenv("AUTH_JWKS_CACHE_SECONDS", "600"))
+JWKS_ALGORITHMS = ("RS256", "ES256")
 
-    token = authorization.split(" ")[1]
-    user = supabase_public.auth.get_user(token)
+JWT_AUDIENCE = os.getenv("AUTH_JWT_AUDIENCE", "authenticated")
+
+# Allowed clock skew between Supabase and this host for exp / iat / nbf
+JWT_LEEWAY_SECONDS = int(os.getenv("AUTH_JWT_LEEWAY_SECONDS", "30"))
+
+# Verified tokens are remembered this long (never past their expiry)
+CLAIMS_CACHE_SIZE = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "10000"))
+CLAIMS_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CLAIMS_CACHE_TTL_SECONDS", "60"))
+
+_claims_cache = TTLCache(maxsize=CLAIMS_CACHE_SIZE, ttl=CLAIMS_CACHE_TTL_SECONDS)
+_claims_lock = threading.Lock()
+
+_jwks_client = None
+
+
+def _get_jwks_client() -> jwt.PyJWKClient:
+    global _jwks_client
+    if _jwks_client is None:
+        _jwks_client = jwt.PyJWKClient(JWKS_URL, cache_keys=True, lifespan=JWKS_CACHE_SECONDS)
+    return _jwks_client
+
+
+# =========================
+# Local Verification
+# =========================
+def verify_token_locally(token: str) -> Optional[dict]:
+    """
+    Checks signature and expiry without calling Supabase.
+    Returns the claims, or None when the token cannot be checked locally
+    (no secret configured, signing key unavailable). Raises 401 for
+    tokens that are definitely invalid.
+    """
+    try:
+        alg = jwt.get_unverified_header(token).get("alg")
+
+        if alg == "HS256":
+            if not JWT_SECRET:
+                return None
+            key = JWT_SECRET
+        elif alg in JWKS_ALGORITHMS:
+            try:
+                key = _get_jwks_client().get_signing_key_from_jwt(token).key
+            except jwt.PyJWKClientError:
+                return None
+        else:
+            return None
+
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[alg],
+            audience=JWT_AUDIENCE,
+            leeway=JWT_LEEWAY_SECONDS,
+            options={"require": ["exp", "sub"]}
+        )
+
+    except jwt.InvalidTokenError:
+        # Bad signature, expired, wrong audience, malformed
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+
+async def _verify_token_remotely(token: str) -> dict:
+    supabase_public = await get_async_public()
+    user = await supabase_public.auth.get_user(token)
 
     if not user or not user.user:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
@@ -19,3 +94,54 @@ def get_current_user(authorization: str = Header(...)):
         "user_id": user.user.id,
         "email": user.user.email
     }
+
+
+def _unverified_expiry(token: str) -> Optional[float]:
+    """
+    The token's exp claim, read without checking the signature. Only
+    used to bound the cache lifetime of a token Supabase has accepted.
+    """
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        return float(exp) if exp is not None else None
+    except (jwt.InvalidTokenError, TypeError, ValueError):
+        return None
+
+
+# =========================
+# Dependency
+# =========================
+async def get_current_user(authorization: str = Header(...)):
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid Authorization header")
+
+    token = authorization.split(" ")[1]
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+
+    with _claims_lock:
+        cached = _claims_cache.get(cache_key)
+    if cached and cached[1] + JWT_LEEWAY_SECONDS > time.time():
+        return cached[0]
+
+    # In a thread: a JWKS refresh is a blocking HTTP call
+    claims = await asyncio.to_thread(verify_token_locally, token)
+
+    if claims is not None:
+        current_user = {
+            "user_id": claims["sub"],
+            "email": claims.get("email")
+        }
+        expires_at = claims["exp"]
+    else:
+        # Inconclusive locally → ask Supabase
+        current_user = await _verify_token_remotely(token)
+        expires_at = time.time() + CLAIMS_CACHE_TTL_SECONDS
+
+        exp = _unverified_expiry(token)
+        if exp is not None:
+            expires_at = min(exp, expires_at)
+
+    with _claims_lock:
+        _claims_cache[cache_key] = (current_user, expires_at)
+
+    return current_user
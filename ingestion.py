@@ -0,0 +1,152 @@
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from python_multipart import MultipartParser
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import parse_options_header
+
+
+class _ImagePart:
+    def __init__(self):
+        self.headers = {}
+        self.field_name = ""
+        self.filename: Optional[str] = None
+        self.data = bytearray()
+
+
+class StreamingImageParser:
+    """
+    Incremental multipart/form-data parser for image uploads.
+
+    Only the part currently being received is held in memory; the size
+    limit is enforced as bytes arrive, so an oversized or excess file
+    aborts the request before the rest of the body is read. A malformed
+    or truncated body is rejected with 400.
+    """
+
+    def __init__(self, boundary: bytes, max_files: int, max_file_bytes: int, field_name: str = "images"):
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.field_name = field_name
+
+        self.completed: List[Tuple[str, str, bytes]] = []
+        self.file_count = 0
+
+        self._part = _ImagePart()
+        self._part_open = False
+        self._ended = False
+        self._header_name = b""
+        self._header_value = b""
+
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_end": self.on_end,
+        })
+
+    # ---------- parser callbacks ----------
+    def on_part_begin(self):
+        self._part = _ImagePart()
+        self._part_open = True
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._part.headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._part.headers.get(b"content-disposition"))
+        self._part.field_name = options.get(b"name", b"").decode("utf-8", "replace")
+
+        if b"filename" in options:
+            self._part.filename = options[b"filename"].decode("utf-8", "replace")
+
+        if self._part.field_name == self.field_name and self._part.filename is not None:
+            self.file_count += 1
+            if self.file_count > self.max_files:
+                raise HTTPException(status_code=400, detail="Too many images")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._part.filename is None:
+            return
+
+        self._part.data += data[start:end]
+
+        if len(self._part.data) > self.max_file_bytes:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{self._part.filename} exceeds {self.max_file_bytes // (1024 * 1024)}MB"
+            )
+
+    def on_part_end(self):
+        self._part_open = False
+        if self._part.field_name != self.field_name or self._part.filename is None:
+            return
+
+        content_type = self._part.headers.get(b"content-type", b"image/png").decode("latin-1")
+        self.completed.append((self._part.filename, content_type, bytes(self._part.data)))
+        self._part = _ImagePart()
+
+    def on_end(self):
+        self._ended = True
+
+    # ---------- feeding ----------
+    def write(self, chunk: bytes):
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed multipart body: {str(e)}")
+
+    def finalize(self):
+        try:
+            self._parser.finalize()
+        except MultipartParseError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed multipart body: {str(e)}")
+
+        # The parser does not check that the body ended at the closing boundary
+        if self._part_open:
+            name = self._part.filename or self._part.field_name
+            raise HTTPException(status_code=400, detail=f"Upload ended in the middle of {name}")
+        if not self._ended:
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+
+
+async def stream_uploaded_images(
+    request: Request,
+    max_files: int,
+    max_file_bytes: int,
+    field_name: str = "images"
+) -> AsyncIterator[Tuple[str, str, bytes]]:
+    """
+    Yields (filename, content_type, content) for each uploaded image as
+    soon as it has been received completely.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data upload")
+
+    parser = StreamingImageParser(boundary, max_files, max_file_bytes, field_name)
+
+    async for chunk in request.stream():
+        parser.write(chunk)
+
+        while parser.completed:
+            yield parser.completed.pop(0)
+
+    parser.finalize()
+
+    while parser.completed:
+        yield parser.completed.pop(0)
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import ConfigurationError, OperationFailure
+
+from job_storage.mongo_init import client, email_outbox_collection, jobs_collection
+
+# ---------- STATUSES ----------
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+# Set when a message is queued in this process, so the sender wakes up
+_outbox_ready = asyncio.Event()
+
+
+# =========================
+# Enqueue
+# =========================
+def _outbox_doc(job: dict, message: dict) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        # One email per job: a retried completion cannot queue it twice
+        "_id": job["job_id"],
+        "message": message,
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "locked_until": None,
+        "created_at": now,
+    }
+
+
+async def complete_job(job: dict, worker_id: str, message: dict):
+    """
+    Deletes the finished job from the queue and queues its email in the
+    same transaction, so a job is never dropped without its notification.
+
+    Standalone MongoDB has no transactions; there the email is queued
+    first (idempotently, keyed by job_id) and the job deleted after.
+    """
+    doc = _outbox_doc(job, message)
+
+    try:
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                await email_outbox_collection.update_one(
+                    {"_id": doc["_id"]},
+                    {"$setOnInsert": doc},
+                    upsert=True,
+                    session=session
+                )
+                await jobs_collection.delete_one(
+                    {"_id": job["_id"], "worker_id": worker_id},
+                    session=session
+                )
+    except (ConfigurationError, OperationFailure) as e:
+        if getattr(e, "code", None) not in (None, 20, 263):
+            raise
+
+        # 20 / 263: transactions not supported by this deployment
+        await email_outbox_collection.update_one(
+            {"_id": doc["_id"]},
+            {"$setOnInsert": doc},
+            upsert=True
+        )
+        await jobs_collection.delete_one({"_id": job["_id"], "worker_id": worker_id})
+
+    _outbox_ready.set()
+
+
+# =========================
+# Sender Side
+# =========================
+async def claim_batch(limit: int, lock_seconds: float) -> List[dict]:
+    """
+    Claims up to limit due messages. A claimed message is locked for
+    lock_seconds so concurrent senders skip it; if the sender dies the
+    lock expires and the message is picked up again.
+    """
+    batch = []
+    now = datetime.now(timezone.utc)
+
+    while len(batch) < limit:
+        doc = await email_outbox_collection.find_one_and_update(
+            {
+                "status": PENDING,
+                "next_attempt_at": {"$lte": now},
+                "$or": [
+                    {"locked_until": None},
+                    {"locked_until": {"$lt": now}}
+                ]
+            },
+            {"$set": {"locked_until": now + timedelta(seconds=lock_seconds)}},
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not doc:
+            break
+        batch.append(doc)
+
+    return batch
+
+
+async def mark_sent(ids: List[str]):
+    if not ids:
+        return
+
+    await email_outbox_collection.update_many(
+        {"_id": {"$in": ids}},
+        {"$set": {"status": SENT, "sent_at": datetime.now(timezone.utc), "locked_until": None}}
+    )
+
+
+async def mark_failed_attempt(doc: dict, error: str, retry_in: float, max_attempts: int):
+    """
+    Schedules the next attempt, or gives up after max_attempts.
+    """
+    attempts = doc.get("attempts", 0) + 1
+    update = {
+        "attempts": attempts,
+        "last_error": error,
+        "locked_until": None,
+        "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=retry_in),
+    }
+
+    if attempts >= max_attempts:
+        update["status"] = FAILED
+
+    await email_outbox_collection.update_one({"_id": doc["_id"]}, {"$set": update})
+    return attempts
+
+
+async def wait_for_message(timeout: float) -> bool:
+    """
+    Waits up to timeout seconds for a message queued in this process.
+    """
+    try:
+        await asyncio.wait_for(_outbox_ready.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        _outbox_ready.clear()
@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from job_storage.mongo_init import jobs_collection, job_results_collection
+from workers.results import ImageResult
+
+# ---------- STAGES ----------
+# Completion markers stored under "checkpoint" on the job document.
+# A retried job skips every stage already marked. (The email is queued
+# in the outbox together with the job's removal, so needs no marker.)
+PREDICTED = "predicted"
+REPORT_UPLOADED = "report_uploaded"
+
+
+def _result_id(job_id: str, idx: int) -> str:
+    return f"{job_id}:{idx}"
+
+
+# =========================
+# Stage Markers
+# =========================
+def stage_done(job: dict, stage: str) -> bool:
+    return bool((job.get("checkpoint") or {}).get(stage))
+
+
+async def mark_stage(job: dict, stage: str, **fields):
+    """
+    Records that stage finished for job (plus any extra checkpoint
+    fields, e.g. report_path). Only the worker holding the lease writes.
+    """
+    update = {f"checkpoint.{stage}": True}
+    update.update({f"checkpoint.{name}": value for name, value in fields.items()})
+
+    await jobs_collection.update_one(
+        {"_id": job["_id"], "worker_id": job.get("worker_id")},
+        {"$set": update}
+    )
+
+    checkpoint = job.setdefault("checkpoint", {})
+    checkpoint[stage] = True
+    checkpoint.update(fields)
+
+
+# =========================
+# Per-Image Results
+# =========================
+# Results (with their JPEG thumbnails) live in job_results, one document
+# per image, rather than inside the job document: 500 thumbnails would
+# push a single document towards Mongo's 16 MB limit.
+async def save_results(job_id: str, entries: List[Tuple[int, ImageResult]]):
+    """
+    Upserts (idx, ImageResult) pairs for job_id.
+    """
+    if not entries:
+        return
+
+    now = datetime.now(timezone.utc)
+    operations = [
+        UpdateOne(
+            {"_id": _result_id(job_id, idx)},
+            {"$set": {
+                "job_id": job_id,
+                "idx": idx,
+                "prediction": result.prediction,
+                "confidence": result.confidence,
+                "probability": result.probability,
+                "thumbnail": result.thumbnail,
+                "created_at": now,
+            }},
+            upsert=True
+        )
+        for idx, result in entries
+    ]
+
+    await job_results_collection.bulk_write(operations, ordered=False)
+
+
+async def load_results(job_id: str, count: int) -> List[Optional[ImageResult]]:
+    """
+    Returns count slots in image order; images without a saved result are None.
+    """
+    results = [None] * count
+
+    async for doc in job_results_collection.find({"job_id": job_id}):
+        idx = doc["idx"]
+        if 0 <= idx < count:
+            results[idx] = ImageResult(
+                prediction=doc["prediction"],
+                confidence=doc["confidence"],
+                probability=doc["probability"],
+                thumbnail=doc.get("thumbnail"),
+            )
+
+    return results
+
+
+async def clear_results(job_id: str):
+    await job_results_collection.delete_many({"job_id": job_id})
@@ -0,0 +1,99 @@
+import os
+import time
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from job_storage.mongo_init import queue_users_collection
+
+# ---------- CONFIG ----------
+# Estimated worker time per job (fixed part) and per image; only their
+# ratio and rough scale matter
+JOB_COST_SECONDS = float(os.getenv("SCHEDULER_JOB_COST_SECONDS", "2"))
+IMAGE_COST_SECONDS = float(os.getenv("SCHEDULER_IMAGE_COST_SECONDS", "0.1"))
+
+# Jobs with at most this many images go to the fast lane
+FAST_LANE_MAX_IMAGES = int(os.getenv("SCHEDULER_FAST_LANE_MAX_IMAGES", "10"))
+
+# Head start of the fast lane over the standard lane
+FAST_LANE_SECONDS = float(os.getenv("SCHEDULER_FAST_LANE_SECONDS", "120"))
+
+FAST = "fast"
+STANDARD = "standard"
+
+LANE_OFFSETS = {
+    FAST: FAST_LANE_SECONDS,
+    STANDARD: 0.0,
+}
+
+# Compare-and-set attempts per enqueue before giving up on the bookkeeping
+_UPDATE_RETRIES = 5
+
+
+# =========================
+# Fair Queueing
+# =========================
+# Weighted fair queueing over users, with wall-clock time as virtual
+# time. Each user has a virtual finish time; a new job starts at
+# max(user's finish, now) and advances it by its cost / user weight.
+# Workers claim the job with the smallest schedule_key, so:
+# - a user with a deep backlog only delays their own later jobs
+# - small jobs finish early in virtual time and overtake large ones
+# - keys are timestamps, so every job ages: once the clock passes
+#   its key plus the fast-lane head start, nothing newer can overtake it
+def job_cost(total_images: int) -> float:
+    return JOB_COST_SECONDS + IMAGE_COST_SECONDS * max(total_images, 0)
+
+
+def lane_for(total_images: int) -> str:
+    return FAST if total_images <= FAST_LANE_MAX_IMAGES else STANDARD
+
+
+def next_finish(previous_finish: Optional[float], now: float, total_images: int, weight: float = 1.0) -> float:
+    """
+    User's virtual finish time after queueing a job of total_images.
+    """
+    start = max(previous_finish or 0.0, now)
+    return start + job_cost(total_images) / max(weight, 1e-6)
+
+
+def schedule_key(finish: float, lane: str) -> float:
+    return finish - LANE_OFFSETS[lane]
+
+
+async def schedule_fields(user_id: str, total_images: int) -> dict:
+    """
+    Advances user_id's virtual finish time and returns the scheduling
+    fields for the job document. Updated compare-and-set, so concurrent
+    enqueues for the same user (several API replicas) each get their turn.
+
+    An optional "weight" on the user's queue_users document gives that
+    user a larger (or smaller) share of the workers.
+    """
+    lane = lane_for(total_images)
+
+    for _ in range(_UPDATE_RETRIES):
+        state = await queue_users_collection.find_one({"_id": user_id}) or {}
+        previous = state.get("virtual_finish")
+        finish = next_finish(previous, time.time(), total_images, state.get("weight", 1.0))
+
+        try:
+            result = await queue_users_collection.update_one(
+                {"_id": user_id, "virtual_finish": previous},
+                {"$set": {"virtual_finish": finish}},
+                upsert=previous is None
+            )
+        except DuplicateKeyError:
+            # Another enqueue created the user's document first
+            continue
+
+        if result.matched_count or result.upserted_id is not None:
+            break
+    # After repeated conflicts the job still gets its last computed key
+    # (at or after the user's backlog); only the bookkeeping is skipped
+
+    return {
+        "total_images": total_images,
+        "lane": lane,
+        "schedule_key": schedule_key(finish, lane),
+    }
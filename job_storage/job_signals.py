@@ -0,0 +1,245 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from job_storage.mongo_init import db
+
+# ---------- CONFIG ----------
+# Size of the capped signal collection; old signals are overwritten
+SIGNALS_CAPPED_BYTES = int(os.getenv("JOB_SIGNALS_CAPPED_BYTES", str(1024 * 1024)))
+
+# Seconds to wait before re-opening the tailable cursor after an error
+TAIL_RETRY_SECONDS = float(os.getenv("JOB_SIGNALS_RETRY_SECONDS", "2"))
+
+JOB_ENQUEUED = "job_enqueued"
+JOB_STATUS = "job_status"
+JOB_PROGRESS = "job_progress"
+
+job_signals_collection = db["job_signals"]
+
+# Set whenever a job is enqueued, in this process or (via the tailer) another one
+_job_ready = asyncio.Event()
+_collection_ready = False
+
+# job_id → queues of the event streams watching it (in-process fan-out)
+_subscribers: Dict[str, Set["JobEventQueue"]] = {}
+
+# Called with every status event (e.g. cache invalidation)
+_status_listeners: List[Callable[[dict], None]] = []
+_tailer: Optional[asyncio.Task] = None
+
+
+# =========================
+# Capped Collection
+# =========================
+async def ensure_signal_collection():
+    """
+    Creates job_signals as a capped collection (tailable cursors need one).
+    """
+    global _collection_ready
+    if _collection_ready:
+        return
+
+    try:
+        await db.create_collection(
+            job_signals_collection.name,
+            capped=True,
+            size=SIGNALS_CAPPED_BYTES
+        )
+        # A tailable cursor on an empty collection dies immediately
+        await job_signals_collection.insert_one(
+            {"type": "init", "ts": datetime.now(timezone.utc)}
+        )
+    except CollectionInvalid:
+        options = await job_signals_collection.options()
+        if not options.get("capped"):
+            await db.command(
+                "convertToCapped",
+                job_signals_collection.name,
+                size=SIGNALS_CAPPED_BYTES
+            )
+
+    _collection_ready = True
+
+
+# =========================
+# Publish
+# =========================
+async def notify_job_enqueued(job_id: str):
+    """
+    Wakes workers in this process immediately and other processes
+    through the capped collection.
+    """
+    _job_ready.set()
+
+    try:
+        await ensure_signal_collection()
+        await job_signals_collection.insert_one({
+            "type": JOB_ENQUEUED,
+            "job_id": job_id,
+            "ts": datetime.now(timezone.utc)
+        })
+    except Exception as e:
+        # Workers fall back to polling; enqueueing must not fail on this
+        print(f"⚠️ Job signal publish failed: {e}")
+
+
+async def _publish_event(signal_type: str, job_id: str, fields: dict):
+    event = {"type": signal_type, "job_id": job_id, **fields}
+
+    try:
+        await ensure_signal_collection()
+        await job_signals_collection.insert_one({**event, "ts": datetime.now(timezone.utc)})
+    except Exception as e:
+        print(f"⚠️ Job event publish failed: {e}")
+        _dispatch(event)
+        return
+
+    # The tailer delivers it otherwise, to this process and every other one
+    if not tailer_running():
+        _dispatch(event)
+
+
+async def notify_job_status(job_id: str, status: str, **fields):
+    """
+    Publishes a status transition (QUEUED / PROGRESSED / DONE / FAILED).
+    """
+    await _publish_event(JOB_STATUS, job_id, {"status": status, **fields})
+
+
+async def notify_job_progress(job_id: str, done: int, total: int):
+    """
+    Publishes how many of a job's images have been predicted.
+    """
+    await _publish_event(JOB_PROGRESS, job_id, {"done": done, "total": total})
+
+
+# =========================
+# In-Process Fan-Out
+# =========================
+def _dispatch(event: dict):
+    if event.get("type") == JOB_STATUS:
+        for listener in _status_listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"⚠️ Job status listener failed: {e}")
+
+    for queue in _subscribers.get(event.get("job_id"), ()):
+        queue.put_nowait(event)
+
+
+def add_status_listener(listener: Callable[[dict], None]):
+    """
+    Registers a callback run (synchronously) for every job status event
+    reaching this process.
+    """
+    _status_listeners.append(listener)
+
+
+class JobEventQueue(asyncio.Queue):
+    """
+    Unbounded queue that stays small: a new progress event replaces one
+    still waiting, so a slow client holds at most one progress event
+    next to the (few) status events, and status events are never dropped.
+    """
+
+    def _put(self, event):
+        if event.get("type") == JOB_PROGRESS:
+            for i, queued in enumerate(self._queue):
+                if queued.get("type") == JOB_PROGRESS:
+                    del self._queue[i]
+                    break
+        self._queue.append(event)
+
+
+def subscribe(job_id: str) -> JobEventQueue:
+    """
+    Returns a queue receiving every status event and the latest progress
+    event for job_id until unsubscribe() is called with it.
+    """
+    queue = JobEventQueue()
+    _subscribers.setdefault(job_id, set()).add(queue)
+    return queue
+
+
+def unsubscribe(job_id: str, queue: JobEventQueue):
+    watchers = _subscribers.get(job_id)
+    if watchers is not None:
+        watchers.discard(queue)
+        if not watchers:
+            del _subscribers[job_id]
+
+
+# =========================
+# Subscribe
+# =========================
+def tailer_running() -> bool:
+    return _tailer is not None and not _tailer.done()
+
+
+def start_tailer() -> Optional[asyncio.Task]:
+    """
+    Starts tail_signals unless this process already runs it.
+    Returns the new task (the caller cancels it), or None.
+    """
+    global _tailer
+    if tailer_running():
+        return None
+
+    _tailer = asyncio.create_task(tail_signals())
+    return _tailer
+
+
+async def tail_signals():
+    """
+    Follows job_signals with a tailable cursor: sets the local wakeup
+    event for every enqueued job and fans job events out to local
+    subscribers. Runs until cancelled.
+    """
+    last_id = None
+
+    while True:
+        try:
+            await ensure_signal_collection()
+
+            if last_id is None:
+                # Start after the newest signal; older ones are stale
+                newest = await job_signals_collection.find_one(sort=[("$natural", -1)])
+                last_id = newest["_id"] if newest else None
+
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            cursor = job_signals_collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+
+            while cursor.alive:
+                async for signal in cursor:
+                    last_id = signal["_id"]
+                    if signal.get("type") == JOB_ENQUEUED:
+                        _job_ready.set()
+                    elif signal.get("type") in (JOB_STATUS, JOB_PROGRESS):
+                        _dispatch({k: v for k, v in signal.items() if k not in ("_id", "ts")})
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Job signal tailing failed, polling only: {e}")
+
+        await asyncio.sleep(TAIL_RETRY_SECONDS)
+
+
+async def wait_for_job(timeout: float) -> bool:
+    """
+    Waits up to timeout seconds for a job to be enqueued.
+    Returns True if woken by a signal, False on timeout.
+    """
+    try:
+        await asyncio.wait_for(_job_ready.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        _job_ready.clear()
@@ -1,13 +1,59 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 MONGO_URL = os.getenv("MONGO_URL")
 
+# Cached predictions expire after this many seconds (default 30 days)
+PREDICTION_CACHE_TTL_SECONDS = int(os.getenv("PREDICTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# Sent outbox emails are kept this many seconds (default 7 days)
+EMAIL_OUTBOX_TTL_SECONDS = int(os.getenv("EMAIL_OUTBOX_TTL_SECONDS", str(7 * 24 * 3600)))
+
 if not MONGO_URL:
     raise RuntimeError("❌ MONGO_URL is not set")
 
 client = AsyncIOMotorClient(MONGO_URL)
 db = client["job_queue_db"]
 jobs_collection = db["jobs"]
+prediction_cache_collection = db["prediction_cache"]
+job_results_collection = db["job_results"]
+email_outbox_collection = db["email_outbox"]
+queue_users_collection = db["queue_users"]
+
+
+async def ensure_indexes():
+    """
+    Creates the indexes the worker relies on. Safe to call on every start.
+    """
+    # Job claiming: smallest schedule_key among unleased / expired-lease jobs
+    await jobs_collection.create_index([("lease_until", 1), ("schedule_key", 1), ("created_at", 1)])
+    await jobs_collection.create_index("created_at")
+    await jobs_collection.create_index("job_id", unique=True)
+
+    # Per-image checkpoints, loaded by job on retry
+    await job_results_collection.create_index("job_id")
+
+    # Email outbox: due messages first; sent ones expire
+    await email_outbox_collection.create_index([("status", 1), ("next_attempt_at", 1)])
+    await email_outbox_collection.create_index(
+        "sent_at",
+        name="sent_at_ttl",
+        expireAfterSeconds=EMAIL_OUTBOX_TTL_SECONDS
+    )
+
+    try:
+        await prediction_cache_collection.create_index(
+            "created_at",
+            name="created_at_ttl",
+            expireAfterSeconds=PREDICTION_CACHE_TTL_SECONDS
+        )
+    except OperationFailure:
+        # Index exists with a different TTL → update it in place
+        await db.command(
+            "collMod",
+            prediction_cache_collection.name,
+            index={"name": "created_at_ttl", "expireAfterSeconds": PREDICTION_CACHE_TTL_SECONDS}
+        )
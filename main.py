@@ -1,2 +1,2 @@
-import tensorflow as tf
-print(tf.__version__)
+import onnxruntime as ort
+print(ort.__version__)
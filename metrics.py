@@ -0,0 +1,176 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+# Port the standalone worker serves /metrics on (0 = off). Each worker
+# process on a host needs its own port; a taken port only disables metrics
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# Set when the API runs several processes (uvicorn --workers N): each
+# process writes its samples there and /metrics aggregates them
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Seconds buckets from 5 ms to 10 min
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300, 600
+)
+
+
+# =========================
+# Worker
+# =========================
+JOB_QUEUE_WAIT = Histogram(
+    "job_queue_wait_seconds",
+    "Time from job creation until a worker picks it up",
+    ["lane"],
+    buckets=LATENCY_BUCKETS
+)
+
+JOB_STAGE_SECONDS = Histogram(
+    "job_stage_seconds",
+    "Time spent per job stage (per image for download / decode, per call otherwise)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+INFERENCE_BATCH_SIZE = Histogram(
+    "inference_batch_size",
+    "Images per ONNX call",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+JOBS_TOTAL = Counter(
+    "jobs_total",
+    "Jobs finished by a worker",
+    ["outcome"]
+)
+
+EMAILS_TOTAL = Counter(
+    "emails_total",
+    "Report emails handled by the outbox sender",
+    ["outcome"]
+)
+
+STAGES = (
+    "manifest_fetch",
+    "download",
+    "decode",
+    "inference_batch",
+    "pdf_render",
+    "report_upload",
+    "signed_url",
+    "email",
+)
+
+# Label children resolved once, so the hot path skips the label lookup
+_stages = {name: JOB_STAGE_SECONDS.labels(stage=name) for name in STAGES}
+
+
+def stage(name: str):
+    """
+    Histogram child for a stage; use as `with stage("decode").time(): ...`
+    """
+    return _stages[name]
+
+
+# =========================
+# API
+# =========================
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "API request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_seconds",
+    "Latency of calls to Supabase (rest / storage / auth)",
+    ["service", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    Plain ASGI middleware (no per-request task or body buffering) that
+    records latency per route template, e.g. /jobs/{job_id}.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+# httpx event hooks for the shared Supabase HTTP client
+async def on_upstream_request(request):
+    request.extensions["metrics_start"] = time.perf_counter()
+
+
+async def on_upstream_response(response):
+    request = response.request
+    start = request.extensions.get("metrics_start")
+    if start is None:
+        return
+
+    # /rest/v1/..., /storage/v1/..., /auth/v1/...
+    service = request.url.path.strip("/").split("/", 1)[0] or "other"
+    UPSTREAM_REQUEST_SECONDS.labels(service, request.method, str(response.status_code)).observe(
+        time.perf_counter() - start
+    )
+
+
+# =========================
+# Exposition
+# =========================
+def render_latest():
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_worker_metrics_server(port: int = WORKER_METRICS_PORT):
+    if not port:
+        return
+
+    try:
+        start_http_server(port)
+    except OSError as e:
+        # e.g. a second worker on the host with the default port
+        print(f"⚠️ Worker metrics disabled, cannot listen on :{port} ({e}); set WORKER_METRICS_PORT per worker")
+        return
+
+    print(f"📈 Worker metrics on :{port}/metrics")
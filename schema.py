@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel, EmailStr
 
 class AuthPayload(BaseModel):
@@ -7,4 +9,9 @@ class AuthPayload(BaseModel):
 
 class JobCreateResponse(BaseModel):
     job_id: str
-    status: str
\ No newline at end of file
+    status: str
+
+
+class JobListResponse(BaseModel):
+    jobs: List[dict]
+    next_cursor: Optional[str] = None
@@ -1,8 +1,9 @@
-from supabase_client.supabase_init import supabase_public
+from supabase_client.supabase_init import get_async_public
 
 
-def signup(email: str, password: str):
-    response = supabase_public.auth.sign_up(
+async def signup(email: str, password: str):
+    supabase_public = await get_async_public()
+    response = await supabase_public.auth.sign_up(
         {
             "email": email,
             "password": password,
@@ -15,8 +16,9 @@ def signup(email: str, password: str):
     }
 
 
-def signin(email: str, password: str):
-    response =  supabase_public.auth.sign_in_with_password(
+async def signin(email: str, password: str):
+    supabase_public = await get_async_public()
+    response = await supabase_public.auth.sign_in_with_password(
         {
             "email": email,
             "password": password,
@@ -28,5 +30,6 @@ def signin(email: str, password: str):
     }
 
 
-def signout():
-    return supabase_public.auth.sign_out()
+async def signout():
+    supabase_public = await get_async_public()
+    return await supabase_public.auth.sign_out()
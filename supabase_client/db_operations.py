@@ -1,13 +1,21 @@
-from typing import Optional
-from supabase_client.supabase_init import supabase_admin
+import base64
+import json
+import re
+import uuid
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+from job_storage.job_signals import notify_job_status
+from supabase_client import job_cache
+from supabase_client.supabase_init import get_async_admin
 
 
 # -----------------------------
 # 1. Insert a new job
 # -----------------------------
-def insert_job(user_id: str, status: str = "QUEUED") -> str:
+async def insert_job(user_id: str, status: str = "QUEUED") -> str:
     try:
-        response = (
+        supabase_admin = await get_async_admin()
+        response = await (
             supabase_admin
             .table("jobs")
             .insert({
@@ -29,7 +37,7 @@ def insert_job(user_id: str, status: str = "QUEUED") -> str:
 # ---------------------------------
 # 2. Update job status
 # ---------------------------------
-def update_job_status(
+async def update_job_status(
     job_id: str,
     status: str,
     report_path: Optional[str] = None
@@ -40,7 +48,8 @@ def update_job_status(
         if report_path:
             payload["report_path"] = report_path
 
-        response = (
+        supabase_admin = await get_async_admin()
+        response = await (
             supabase_admin
             .table("jobs")
             .update(payload)
@@ -54,13 +63,17 @@ def update_job_status(
     except Exception as e:
         raise RuntimeError(f"[JOB UPDATE FAILED] {str(e)}") from e
 
+    # Pushed to GET /jobs/{job_id}/events listeners in every process
+    await notify_job_status(job_id, status, **({"report_path": report_path} if report_path else {}))
+
 
 # ---------------------------------
 # 3. Delete a job
 # ---------------------------------
-def delete_job(job_id: str) -> None:
+async def delete_job(job_id: str) -> None:
     try:
-        response = (
+        supabase_admin = await get_async_admin()
+        response = await (
             supabase_admin
             .table("jobs")
             .delete()
@@ -74,22 +87,151 @@ def delete_job(job_id: str) -> None:
     except Exception as e:
         raise RuntimeError(f"[JOB DELETE FAILED] {str(e)}") from e
 
+    job_cache.invalidate_job(job_id)
+
 
 # ---------------------------------
-# 4. Return all jobs for a user
+# 4. Return a page of a user's jobs
 # ---------------------------------
-def returning_all_jobs(user_id: str):
+# Keyset pagination, newest first. Served by the index
+#   CREATE INDEX jobs_user_created_idx ON jobs (user_id, created_at DESC, job_id DESC);
+JOB_FIELDS = ("job_id", "user_id", "status", "report_path", "created_at")
+JOB_STATUSES = ("QUEUED", "PROGRESSED", "DONE", "FAILED")
+
+# Always selected: the cursor is built from them
+CURSOR_FIELDS = ("created_at", "job_id")
+
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["job_id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _parse_timestamp(value: str) -> datetime:
+    # Postgres trims trailing zeros from the fraction; older Pythons only
+    # accept 3 or 6 digits there
+    value = re.sub(r"\.(\d{1,6})(?=\D|$)", lambda m: "." + m.group(1).ljust(6, "0"), value, count=1)
+    return datetime.fromisoformat(value)
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Raises ValueError for a cursor that was not produced by encode_cursor.
+    Both values end up inside a PostgREST filter, so they are re-serialized
+    from a parsed timestamp / UUID rather than passed through.
+    """
     try:
-        response = (
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, job_id = json.loads(raw)
+        created_at = _parse_timestamp(created_at).isoformat()
+        job_id = str(uuid.UUID(job_id))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+    return created_at, job_id
+
+
+async def list_user_jobs(
+    user_id: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    fields: Sequence[str] = JOB_FIELDS,
+    statuses: Optional[Sequence[str]] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Cost depends on limit only, not on the size of the user's history.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    columns = ",".join(dict.fromkeys([*fields, *CURSOR_FIELDS]))
+
+    try:
+        supabase_admin = await get_async_admin()
+        query = (
             supabase_admin
             .table("jobs")
-            .select("*")
+            .select(columns)
             .eq("user_id", user_id)
+        )
+
+        if statuses:
+            query = query.in_("status", list(statuses))
+        if created_after:
+            query = query.gte("created_at", created_after.isoformat())
+        if created_before:
+            query = query.lt("created_at", created_before.isoformat())
+
+        if after:
+            created_at, job_id = after
+            # (created_at, job_id) < cursor, in PostgREST syntax
+            query = query.or_(
+                f'created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",job_id.lt."{job_id}")'
+            )
+
+        response = await (
+            query
             .order("created_at", desc=True)
+            .order("job_id", desc=True)
+            .limit(limit + 1)
             .execute()
         )
 
-        return response.data or []
-
     except Exception as e:
         raise RuntimeError(f"[FETCH JOBS FAILED] {str(e)}") from e
+
+    rows = response.data or []
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    # Drop cursor columns the caller did not ask for
+    extra = [name for name in CURSOR_FIELDS if name not in fields]
+    if extra:
+        rows = [{k: v for k, v in row.items() if k not in extra} for row in rows]
+
+    return rows, next_cursor
+
+
+# ---------------------------------
+# 5. Return one job owned by a user
+# ---------------------------------
+async def get_user_job(job_id: str, user_id: str, columns: str = "*") -> Optional[dict]:
+    """
+    Returns the job row (only the given columns), or None if it does not
+    exist or is not user_id's. Rows are served from job_cache until the
+    job's status changes.
+    """
+    row = job_cache.get_job_row(job_id)
+
+    if row is None:
+        generation = job_cache.generation()
+        try:
+            supabase_admin = await get_async_admin()
+            response = await (
+                supabase_admin
+                .table("jobs")
+                .select("*")
+                .eq("job_id", job_id)
+                .eq("user_id", user_id)
+                .limit(1)
+                .execute()
+            )
+
+        except Exception as e:
+            raise RuntimeError(f"[FETCH JOB FAILED] {str(e)}") from e
+
+        if not response.data:
+            return None
+
+        row = response.data[0]
+        job_cache.put_job_row(job_id, row, generation)
+
+    if row.get("user_id") != user_id:
+        return None
+
+    if columns == "*":
+        return dict(row)
+
+    return {name: row.get(name) for name in columns.split(",")}
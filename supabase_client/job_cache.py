@@ -0,0 +1,70 @@
+import os
+import time
+from typing import Optional
+
+from cachetools import LRUCache, TTLCache
+
+from job_storage import job_signals
+
+# ---------- CONFIG ----------
+# Job rows are also dropped as soon as the worker changes their status;
+# the TTL only bounds staleness if a status event is missed
+JOB_CACHE_SIZE = int(os.getenv("JOB_CACHE_SIZE", "10000"))
+JOB_CACHE_TTL_SECONDS = float(os.getenv("JOB_CACHE_TTL_SECONDS", "60"))
+
+# Signed URLs are reused for this fraction of their lifetime, so a
+# cached link always has some validity left when it is handed out
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000"))
+SIGNED_URL_REUSE_FRACTION = float(os.getenv("SIGNED_URL_REUSE_FRACTION", "0.8"))
+
+_job_rows = TTLCache(maxsize=JOB_CACHE_SIZE, ttl=JOB_CACHE_TTL_SECONDS)
+
+# report path → (bucket, expiry_seconds, url, reuse_until)
+_signed_urls = LRUCache(maxsize=SIGNED_URL_CACHE_SIZE)
+
+# Bumped by every invalidation; a fetch that raced one is not cached
+_generation = 0
+
+
+# =========================
+# Job Rows
+# =========================
+def generation() -> int:
+    return _generation
+
+
+def get_job_row(job_id: str) -> Optional[dict]:
+    return _job_rows.get(job_id)
+
+
+def put_job_row(job_id: str, row: dict, fetched_at_generation: int):
+    if fetched_at_generation == _generation:
+        _job_rows[job_id] = row
+
+
+def invalidate_job(job_id: str):
+    global _generation
+    _generation += 1
+
+    row = _job_rows.pop(job_id, None)
+    if row and row.get("report_path"):
+        _signed_urls.pop(row["report_path"], None)
+
+
+# =========================
+# Signed URLs
+# =========================
+def get_signed_url(bucket: str, path: str, expiry_seconds: int) -> Optional[str]:
+    entry = _signed_urls.get(path)
+    if entry and entry[:2] == (bucket, expiry_seconds) and entry[3] > time.monotonic():
+        return entry[2]
+    return None
+
+
+def put_signed_url(bucket: str, path: str, expiry_seconds: int, url: str):
+    reuse_for = expiry_seconds * SIGNED_URL_REUSE_FRACTION
+    _signed_urls[path] = (bucket, expiry_seconds, url, time.monotonic() + reuse_for)
+
+
+# The worker's update_job_status reaches every API process as a status event
+job_signals.add_status_listener(lambda event: invalidate_job(event["job_id"]))
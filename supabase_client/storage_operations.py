@@ -1,12 +1,138 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+import asyncio
 import json
-from supabase_client.supabase_init import supabase_admin
+import os
+from supabase_client import job_cache
+from supabase_client.supabase_init import get_async_admin
+
+# Concurrent uploads per request; also bounds the image bytes held in memory
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "8"))
+
+# Retries per file, with exponential backoff starting at UPLOAD_BACKOFF_SECONDS
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "3"))
+UPLOAD_BACKOFF_SECONDS = float(os.getenv("UPLOAD_BACKOFF_SECONDS", "0.5"))
 
 
 # -----------------------------
 # 1. Upload images + manifest
 # -----------------------------
-def upload_images_and_manifest(
+async def upload_image(
+    bucket: str,
+    remote_path: str,
+    content: bytes,
+    content_type: str = "image/png",
+    upsert: bool = False
+) -> None:
+    try:
+        supabase_admin = await get_async_admin()
+        await supabase_admin.storage.from_(bucket).upload(
+            path=remote_path,
+            file=content,
+            file_options={"content-type": content_type, "upsert": str(upsert).lower()}
+        )
+
+    except Exception as e:
+        raise RuntimeError(f"[UPLOAD FAILED] {str(e)}") from e
+
+
+async def upload_manifest(
+    bucket: str,
+    manifest: Dict,
+    manifest_remote_path: str,
+    upsert: bool = False
+) -> None:
+    try:
+        manifest_bytes = json.dumps(manifest).encode("utf-8")
+        supabase_admin = await get_async_admin()
+        await supabase_admin.storage.from_(bucket).upload(
+            path=manifest_remote_path,
+            file=manifest_bytes,
+            file_options={"content-type": "application/json", "upsert": str(upsert).lower()}
+        )
+
+    except Exception as e:
+        raise RuntimeError(f"[UPLOAD FAILED] {str(e)}") from e
+
+
+class BatchUploader:
+    """
+    Uploads a job's images concurrently, at most max_concurrency at a time.
+
+    Uploads run on the shared async admin client, so they reuse its
+    keep-alive connection pool. Each file is retried with exponential backoff. If any
+    file still fails, commit() removes everything this uploader stored
+    and the manifest is never written.
+    """
+
+    def __init__(self, bucket: str, max_concurrency: int = UPLOAD_CONCURRENCY):
+        self.bucket = bucket
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: List[asyncio.Task] = []
+        self._uploaded: List[str] = []
+        self._error: Optional[BaseException] = None
+
+    async def submit(self, remote_path: str, content: bytes, content_type: str = "image/png") -> None:
+        """
+        Starts uploading one file. Waits while max_concurrency uploads are
+        in flight and raises as soon as an earlier upload has failed.
+        """
+        await self._slots.acquire()
+
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+
+        self._tasks.append(
+            asyncio.create_task(self._upload(remote_path, content, content_type))
+        )
+
+    async def _upload(self, remote_path: str, content: bytes, content_type: str) -> None:
+        try:
+            await _with_retries(upload_image, self.bucket, remote_path, content, content_type)
+            self._uploaded.append(remote_path)
+        except Exception as e:
+            self._error = self._error or e
+            raise
+        finally:
+            self._slots.release()
+
+    async def commit(self, manifest: Dict, manifest_remote_path: str) -> None:
+        """
+        Waits for every image, then writes the manifest.
+        """
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        if self._error is not None:
+            await self.rollback()
+            raise self._error
+
+        await _with_retries(upload_manifest, self.bucket, manifest, manifest_remote_path)
+        self._uploaded.append(manifest_remote_path)
+
+    async def rollback(self) -> None:
+        """
+        Waits for in-flight uploads and deletes everything already stored,
+        the manifest included (e.g. when enqueueing fails after commit).
+        """
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        if self._uploaded:
+            await remove_objects(self.bucket, self._uploaded)
+            self._uploaded = []
+
+
+async def _with_retries(upload_fn, *args):
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            # A retry may follow an upload that landed but timed out
+            return await upload_fn(*args, upsert=attempt > 0)
+        except RuntimeError:
+            if attempt == UPLOAD_RETRIES:
+                raise
+            await asyncio.sleep(UPLOAD_BACKOFF_SECONDS * 2 ** attempt)
+
+
+async def upload_images_and_manifest(
     bucket: str,
     images: List[Tuple[str, bytes]],
     manifest: Dict,
@@ -16,55 +142,71 @@ def upload_images_and_manifest(
     """
     images: List of (filename, bytes)
     """
+    uploader = BatchUploader(bucket)
+
     try:
         # Upload images
         for filename, content in images:
-            supabase_admin.storage.from_(bucket).upload(
-                path=f"{input_prefix}/{filename}",
-                file=content,
-                file_options={"content-type": "image/png"}
-            )
+            await uploader.submit(f"{input_prefix}/{filename}", content)
 
-        # Upload manifest.json
-        manifest_bytes = json.dumps(manifest).encode("utf-8")
-        supabase_admin.storage.from_(bucket).upload(
-            path=manifest_remote_path,
-            file=manifest_bytes,
-            file_options={"content-type": "application/json"}
-        )
+    except Exception:
+        await uploader.rollback()
+        raise
+
+    # Upload manifest.json (only once every image is stored)
+    await uploader.commit(manifest, manifest_remote_path)
+
+
+async def remove_objects(bucket: str, paths: List[str]) -> None:
+    try:
+        supabase_admin = await get_async_admin()
+        await supabase_admin.storage.from_(bucket).remove(paths)
 
     except Exception as e:
-        raise RuntimeError(f"[UPLOAD FAILED] {str(e)}") from e
+        raise RuntimeError(f"[DELETE FAILED] {str(e)}") from e
+
+
+async def remove_input_images(bucket: str, input_prefix: str) -> None:
+    """
+    Deletes every object directly under input_prefix.
+    """
+    try:
+        supabase_admin = await get_async_admin()
+        files = await supabase_admin.storage.from_(bucket).list(input_prefix)
+
+        delete_targets = [
+            f"{input_prefix}/{f['name']}"
+            for f in files
+        ]
+
+        if delete_targets:
+            await supabase_admin.storage.from_(bucket).remove(delete_targets)
+
+    except Exception as e:
+        raise RuntimeError(f"[DELETE FAILED] {str(e)}") from e
 
 
 # -------------------------------------------------
 # 2. Upload report + delete input images
 # -------------------------------------------------
-def delete_images_create_report(
+async def delete_images_create_report(
     bucket: str,
     input_prefix: str,
     report_prefix: str,
-    report_filename: str
+    report_filename: str,
+    report_bytes: bytes
 ) -> str:
     try:
-        # Upload report FIRST
-        with open(report_filename, "rb") as pdf_file:
-            supabase_admin.storage.from_(bucket).upload(
-                path=f"{report_prefix}/{report_filename}",
-                file=pdf_file,
-                file_options={"content-type": "application/pdf"}
-            )
+        # Upload report FIRST (upsert: a retried job may re-upload it)
+        supabase_admin = await get_async_admin()
+        await supabase_admin.storage.from_(bucket).upload(
+            path=f"{report_prefix}/{report_filename}",
+            file=report_bytes,
+            file_options={"content-type": "application/pdf", "upsert": "true"}
+        )
 
         # Delete input images
-        files = supabase_admin.storage.from_(bucket).list(input_prefix)
-
-        delete_targets = [
-            f"{input_prefix}/{f['name']}"
-            for f in files
-        ]
-
-        if delete_targets:
-            supabase_admin.storage.from_(bucket).remove(delete_targets)
+        await remove_input_images(bucket, input_prefix)
 
         return f"{report_prefix}/{report_filename}"
 
@@ -75,13 +217,21 @@ def delete_images_create_report(
 # ---------------------------------
 # 3. Create signed URL
 # ---------------------------------
-def create_signed_report_url(
+async def create_signed_report_url(
     bucket: str,
     report_path: str,
     expiry_seconds: int = 86400
 ) -> str:
+    """
+    Reuses a cached URL for most of its lifetime (see job_cache).
+    """
+    cached = job_cache.get_signed_url(bucket, report_path, expiry_seconds)
+    if cached:
+        return cached
+
     try:
-        response = supabase_admin.storage.from_(bucket).create_signed_url(
+        supabase_admin = await get_async_admin()
+        response = await supabase_admin.storage.from_(bucket).create_signed_url(
             path=report_path,
             expires_in=expiry_seconds
         )
@@ -90,6 +240,7 @@ def create_signed_report_url(
         if not signed_url:
             raise ValueError("Signed URL not returned")
 
+        job_cache.put_signed_url(bucket, report_path, expiry_seconds, signed_url)
         return signed_url
 
     except Exception as e:
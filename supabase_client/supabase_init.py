@@ -1,5 +1,10 @@
+import asyncio
 import os
-from supabase import create_client, Client
+from typing import Optional
+
+import httpx
+import metrics
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,10 +13,75 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 ANON_KEY = os.getenv("ANON_KEY")
 SERVICE_ROLE_KEY = os.getenv("SERVICE_ROLE_KEY")
 
+# Shared async HTTP pool (keep-alive connections reused across requests)
+HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("SUPABASE_HTTP_KEEPALIVE_SECONDS", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_HTTP_TIMEOUT_SECONDS", "30"))
+
+
+# =========================
+# Async Clients
+# =========================
+# User-level (RLS enforced) and backend-level (RLS bypassed) clients on
+# one pooled httpx.AsyncClient. Created on first use inside the running
+# event loop; close_async_clients() on shutdown.
+_http_client: Optional[httpx.AsyncClient] = None
+_async_public: Optional[AsyncClient] = None
+_async_admin: Optional[AsyncClient] = None
+_init_lock = asyncio.Lock()
+
+
+async def _init_async_clients():
+    global _http_client, _async_public, _async_admin
+
+    async with _init_lock:
+        if _async_admin is not None:
+            return
+
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=HTTP_TIMEOUT_SECONDS,
+            event_hooks={
+                "request": [metrics.on_upstream_request],
+                "response": [metrics.on_upstream_response]
+            },
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+            )
+        )
+
+        def options():
+            # Server-side clients: no session kept between requests
+            return AsyncClientOptions(
+                httpx_client=_http_client,
+                persist_session=False,
+                auto_refresh_token=False
+            )
+
+        _async_public = await acreate_client(SUPABASE_URL, ANON_KEY, options())
+        _async_admin = await acreate_client(SUPABASE_URL, SERVICE_ROLE_KEY, options())
+
+
+async def get_async_public() -> AsyncClient:
+    if _async_public is None:
+        await _init_async_clients()
+    return _async_public
+
+
+async def get_async_admin() -> AsyncClient:
+    if _async_admin is None:
+        await _init_async_clients()
+    return _async_admin
+
 
+async def close_async_clients():
+    global _http_client, _async_public, _async_admin
 
-# User-level client (RLS enforced)
-supabase_public: Client = create_client(SUPABASE_URL, ANON_KEY)
+    if _http_client is not None:
+        await _http_client.aclose()
 
-# Backend-level client (RLS bypassed)
-supabase_admin: Client = create_client(SUPABASE_URL, SERVICE_ROLE_KEY)
+    _http_client = _async_public = _async_admin = None
@@ -0,0 +1,144 @@
+"""
+send_pending against LocalTransport and an in-memory outbox that follows
+the job_storage.email_outbox contract (claim with a lock, backoff, give
+up after max attempts).
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# The outbox module only needs a Mongo URL to import; nothing connects
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+from job_storage.email_outbox import FAILED, PENDING, SENT  # noqa: E402
+from workers import email_worker  # noqa: E402
+
+
+class FakeOutbox:
+    def __init__(self, recipients):
+        now = datetime.now(timezone.utc)
+        self.docs = {
+            f"job{i}": {
+                "_id": f"job{i}",
+                "message": email_worker.report_email(to, f"user{i}", "https://example.com/report"),
+                "status": PENDING,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "locked_until": None,
+            }
+            for i, to in enumerate(recipients)
+        }
+
+    async def claim_batch(self, limit, lock_seconds):
+        now = datetime.now(timezone.utc)
+        due = sorted(
+            (
+                doc for doc in self.docs.values()
+                if doc["status"] == PENDING
+                and doc["next_attempt_at"] <= now
+                and (doc["locked_until"] is None or doc["locked_until"] < now)
+            ),
+            key=lambda doc: doc["next_attempt_at"]
+        )[:limit]
+
+        for doc in due:
+            doc["locked_until"] = now + timedelta(seconds=lock_seconds)
+        return [dict(doc) for doc in due]
+
+    async def mark_sent(self, ids):
+        for _id in ids:
+            self.docs[_id].update(status=SENT, locked_until=None)
+
+    async def mark_failed_attempt(self, doc, error, retry_in, max_attempts):
+        attempts = doc.get("attempts", 0) + 1
+        self.docs[doc["_id"]].update(
+            attempts=attempts,
+            last_error=error,
+            locked_until=None,
+            next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=retry_in),
+            status=FAILED if attempts >= max_attempts else PENDING
+        )
+        return attempts
+
+    def status(self, _id):
+        return self.docs[_id]["status"]
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    def make(recipients):
+        fake = FakeOutbox(recipients)
+        for name in ("claim_batch", "mark_sent", "mark_failed_attempt"):
+            monkeypatch.setattr(email_worker.email_outbox, name, getattr(fake, name))
+        return fake
+
+    return make
+
+
+def send(transport):
+    return asyncio.run(email_worker.send_pending(transport, email_worker.RateLimiter(0)))
+
+
+def test_bad_recipient_does_not_fail_its_batch(outbox):
+    fake = outbox([f"user{i}@example.com" for i in range(5)] + ["not-an-address"])
+    transport = email_worker.LocalTransport()
+    transport.rejected.add("not-an-address")
+
+    assert send(transport) == 5
+    assert sorted(m["to"][0] for m in transport.sent) == [f"user{i}@example.com" for i in range(5)]
+
+    bad = fake.docs["job5"]
+    assert bad["status"] == PENDING
+    assert bad["attempts"] == 1
+    assert bad["next_attempt_at"] > datetime.now(timezone.utc)
+
+
+def test_provider_outage_backs_off(outbox, monkeypatch):
+    monkeypatch.setattr(email_worker, "EMAIL_BACKOFF_SECONDS", 60)
+    fake = outbox(["a@example.com", "b@example.com"])
+    transport = email_worker.LocalTransport()
+    transport.fail_next = 100
+
+    assert send(transport) == 0
+    for doc in fake.docs.values():
+        assert doc["attempts"] == 1
+        assert doc["next_attempt_at"] > datetime.now(timezone.utc) + timedelta(seconds=50)
+
+    # Nothing is due again until the backoff has passed
+    calls = transport.calls
+    assert send(transport) == 0
+    assert transport.calls == calls
+
+
+def test_gives_up_after_max_attempts(outbox, monkeypatch):
+    monkeypatch.setattr(email_worker, "EMAIL_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(email_worker, "EMAIL_BACKOFF_SECONDS", 0)
+    fake = outbox(["ok@example.com", "bad@example.com"])
+    transport = email_worker.LocalTransport()
+    transport.rejected.add("bad@example.com")
+
+    for _ in range(5):
+        send(transport)
+
+    assert fake.status("job0") == SENT
+    assert fake.status("job1") == FAILED
+    assert fake.docs["job1"]["attempts"] == 3
+    assert len(transport.sent) == 1
+
+
+def test_concurrent_senders_deliver_each_message_once(outbox, monkeypatch):
+    monkeypatch.setattr(email_worker, "EMAIL_BATCH_SIZE", 3)
+    fake = outbox([f"user{i}@example.com" for i in range(10)])
+    transport = email_worker.LocalTransport()
+
+    async def two_senders():
+        return await asyncio.gather(
+            email_worker.send_pending(transport, email_worker.RateLimiter(0)),
+            email_worker.send_pending(transport, email_worker.RateLimiter(0)),
+        )
+
+    assert sum(asyncio.run(two_senders())) == 10
+    assert len(transport.sent) == 10
+    assert all(fake.status(_id) == SENT for _id in fake.docs)
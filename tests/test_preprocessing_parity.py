@@ -0,0 +1,33 @@
+"""
+preprocess_image must stay within PARITY_TOLERANCE of the original
+TensorFlow preprocessing. The golden arrays next to each fixture image
+were produced once with TensorFlow by
+`python tools/image_prep_parity.py --write-goldens tests/fixtures/preprocessing ...`.
+"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from workers.preprocessing import IMG_SIZE, PARITY_TOLERANCE, preprocess_image
+
+FIXTURES = Path(__file__).parent / "fixtures" / "preprocessing"
+
+CASES = [
+    "rgb_wide.png",   # 300 x 120, odd aspect ratio
+    "rgb_tall.jpg",   # 97 x 301, JPEG with odd dimensions
+    "rgba.png",       # alpha channel dropped
+    "gray.png",       # 8-bit greyscale
+    "gray16.png",     # 16-bit greyscale
+]
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_matches_tensorflow(name):
+    expected = np.load(FIXTURES / f"{name}.npy").astype(np.float32)
+    actual = preprocess_image((FIXTURES / name).read_bytes())
+
+    assert actual.shape == (*IMG_SIZE, 3)
+    assert actual.dtype == np.float32
+    # float16 goldens add up to ~5e-4 of rounding
+    assert np.abs(actual - expected).max() <= PARITY_TOLERANCE + 1e-3
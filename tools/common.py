@@ -0,0 +1,49 @@
+"""
+Helpers shared by the scripts in tools/. Each script runs with tools/ on
+sys.path, so they import this as `common`.
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"}
+
+# Import time (s), resident memory (MB), which watched modules got loaded
+# and whether the worker's ONNX model was loaded
+_PROBE = (
+    "import json, sys, time; t = time.perf_counter(); import {module}; t = time.perf_counter() - t; "
+    "rss = [l for l in open('/proc/self/status') if l.startswith('VmRSS')][0].split()[1]; "
+    "prediction = sys.modules.get('workers.prediction'); "
+    "print(json.dumps({{'seconds': t, 'rss_mb': int(rss) / 1024, "
+    "'loaded': [m for m in {watched!r} if m in sys.modules], "
+    "'model_loaded': getattr(prediction, '_model', None) is not None}}))"
+)
+
+
+def collect_images(paths):
+    """
+    Image files under the given files / directories, directories sorted.
+    """
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+        else:
+            yield path
+
+
+def probe_import(module: str, watched=()) -> dict:
+    """
+    Imports module in a fresh interpreter (from the repo root) and returns
+    {"seconds", "rss_mb", "loaded", "model_loaded"}.
+    """
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, watched=tuple(watched))],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    ).stdout.splitlines()
+    return json.loads(out[-1])
@@ -0,0 +1,100 @@
+"""
+Checks workers.preprocessing.preprocess_image against the original
+TensorFlow preprocessing and reports the startup / memory difference.
+
+Usage:
+    python tools/image_prep_parity.py path/to/images [more/images ...]
+    python tools/image_prep_parity.py --write-goldens DIR path/to/images ...
+
+--write-goldens stores the TensorFlow output of every image as
+DIR/<name>.npy (float16), the fixtures tests/test_preprocessing_parity.py
+checks against. TensorFlow is only needed here, not by the worker or
+the tests.
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import collect_images, probe_import  # noqa: E402
+from workers.preprocessing import IMG_SIZE, PARITY_TOLERANCE, preprocess_image  # noqa: E402
+
+
+def tf_preprocess(tf, image_bytes: bytes) -> np.ndarray:
+    image = tf.image.decode_image(image_bytes, channels=3, expand_animations=False)
+    image = tf.image.resize(image, IMG_SIZE)
+    return (tf.cast(image, tf.float32) / 255.0).numpy()
+
+
+def write_goldens(tf, out_dir: Path, paths) -> int:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    images = list(collect_images(paths))
+
+    for path in images:
+        # float16 halves the fixture size; its rounding is far below the tolerance
+        expected = tf_preprocess(tf, path.read_bytes()).astype(np.float16)
+        np.save(out_dir / f"{path.name}.npy", expected)
+        print(f"💾 {out_dir / path.name}.npy")
+
+    return 0 if images else 1
+
+
+def main(paths) -> int:
+    import tensorflow as tf
+
+    worst = 0.0
+    total_mean = 0.0
+    tf_time = np_time = 0.0
+    images = list(collect_images(paths))
+
+    for path in images:
+        image_bytes = path.read_bytes()
+
+        start = time.perf_counter()
+        expected = tf_preprocess(tf, image_bytes)
+        tf_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = preprocess_image(image_bytes)
+        np_time += time.perf_counter() - start
+
+        delta = np.abs(expected - actual)
+        diff = float(delta.max())
+        worst = max(worst, diff)
+        total_mean += float(delta.mean())
+        status = "ok" if diff <= PARITY_TOLERANCE else "FAIL"
+        print(f"{status:4} max|Δ|={diff:.6f}  mean|Δ|={delta.mean():.6f}  {path}")
+
+    if not images:
+        print("No images found")
+        return 1
+
+    print(f"\nImages: {len(images)}  worst max|Δ|={worst:.6f}  "
+          f"mean|Δ|={total_mean / len(images):.6f}  tolerance={PARITY_TOLERANCE:.6f}")
+    print(f"Per image: tensorflow {tf_time / len(images) * 1000:.2f} ms, "
+          f"pillow/numpy {np_time / len(images) * 1000:.2f} ms")
+
+    tf_probe = probe_import("tensorflow")
+    np_probe = probe_import("numpy, PIL.Image")
+    print(f"Import: tensorflow {tf_probe['seconds']:.2f} s / {tf_probe['rss_mb']:.0f} MB RSS, "
+          f"pillow+numpy {np_probe['seconds']:.2f} s / {np_probe['rss_mb']:.0f} MB RSS")
+
+    return 0 if worst <= PARITY_TOLERANCE else 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    if sys.argv[1] == "--write-goldens":
+        if len(sys.argv) < 4:
+            print(__doc__)
+            sys.exit(2)
+        import tensorflow as tf
+        sys.exit(write_goldens(tf, Path(sys.argv[2]), sys.argv[3:]))
+
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+"""
+Measures the import cost of the API and worker entry points and fails
+when either regresses.
+
+Each entry point is imported in a fresh interpreter. The API must not
+pull in any worker-only dependency (onnxruntime, ReportLab, numpy,
+Pillow, the worker modules), and neither entry point may load the ONNX
+model at import time; the worker loads it in run_worker.
+
+Usage:
+    python tools/import_benchmark.py [--repeat N]
+        [--max-app-seconds S] [--max-worker-seconds S]
+"""
+import argparse
+import statistics
+import sys
+
+from common import probe_import
+
+# Modules only the worker needs
+WORKER_ONLY = (
+    "onnxruntime",
+    "reportlab",
+    "numpy",
+    "PIL",
+    "workers.worker",
+    "workers.prediction",
+    "workers.pdf_creator",
+)
+
+def measure(module: str, repeat: int) -> dict:
+    runs = [probe_import(module, WORKER_ONLY) for _ in range(repeat)]
+    return {
+        "seconds": statistics.median(r["seconds"] for r in runs),
+        "rss_mb": statistics.median(r["rss_mb"] for r in runs),
+        "loaded": runs[-1]["loaded"],
+        "model_loaded": any(r["model_loaded"] for r in runs),
+    }
+
+
+def main(args) -> int:
+    failures = []
+    budgets = {"app": args.max_app_seconds, "workers.worker": args.max_worker_seconds}
+
+    print("Entry point      import s   RSS MB")
+    for module, budget in budgets.items():
+        result = measure(module, args.repeat)
+        print(f"{module:15}  {result['seconds']:8.2f}  {result['rss_mb']:7.0f}")
+
+        if result["seconds"] > budget:
+            failures.append(f"{module} imports in {result['seconds']:.2f} s (budget {budget:.2f} s)")
+        if result["model_loaded"]:
+            failures.append(f"{module} loads the ONNX model at import time")
+        if module == "app" and result["loaded"]:
+            failures.append(f"app imports worker-only modules: {', '.join(result['loaded'])}")
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"⛔ {failure}")
+        return 1
+
+    print("\n✅ Import budgets met")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per entry point")
+    parser.add_argument("--max-app-seconds", type=float, default=2.0)
+    parser.add_argument("--max-worker-seconds", type=float, default=3.0)
+    sys.exit(main(parser.parse_args()))
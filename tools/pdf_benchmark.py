@@ -0,0 +1,72 @@
+"""
+Measures PDF report generation time and size for 1, 10 and 100 images.
+
+Usage:
+    python tools/pdf_benchmark.py [--repeat N] [sizes ...]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from workers import pdf_creator  # noqa: E402
+from workers.preprocessing import encode_thumbnail  # noqa: E402
+from workers.results import ImageResult  # noqa: E402
+
+
+def synthetic_results(count: int, seed: int = 0):
+    """
+    Smooth random images (closer to photos than white noise) with
+    alternating labels, as ImageResults like predict_batch returns.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:224, 0:224].astype(np.float32)
+    results = []
+
+    for i in range(count):
+        fx, fy, phase = rng.uniform(5, 40, size=3)
+        image = np.stack([
+            np.sin(x / fx + phase),
+            np.cos(y / fy - phase),
+            np.sin((x + y) / (fx + fy)),
+        ], axis=-1) * 0.4 + 0.5
+        image += rng.normal(0, 0.03, image.shape)
+
+        results.append(ImageResult(
+            prediction="AI Generated" if i % 3 else "Real",
+            confidence=round(float(rng.uniform(50, 100)), 2),
+            probability=float(rng.uniform()),
+            thumbnail=encode_thumbnail(np.clip(image, 0, 1).astype(np.float32)),
+        ))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int, default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'images':>7} {'ms/report':>10} {'KB/report':>10} {'KB/image':>9}")
+
+    for size in args.sizes:
+        results = synthetic_results(size)
+        pdf_creator.create_pdf_report(results)  # warm-up
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            pdf_bytes = pdf_creator.create_pdf_report(results)
+            timings.append(time.perf_counter() - start)
+
+        kb = len(pdf_bytes) / 1024
+        print(f"{size:>7} {min(timings) * 1000:>10.1f} {kb:>10.1f} {kb / size:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
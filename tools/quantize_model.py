@@ -0,0 +1,207 @@
+"""
+Builds the INT8 model variant and checks it against the FP32 model.
+
+Static quantization (default) calibrates activation ranges on local
+images; dynamic quantization only needs the weights. The quantized model
+is then compared with FP32 on held-out images: latency, throughput,
+probability drift and label flips at the prediction threshold. The exit
+status is 0 only when the INT8 model stays within the accuracy budget,
+so MODEL_VARIANT=int8 should only be set after a passing run.
+
+onnxruntime.quantization needs the onnx package (pinned in
+Requirements.txt); the worker itself only uses onnxruntime.
+
+Usage:
+    python tools/quantize_model.py path/to/images [more/images ...]
+        [--mode static|dynamic] [--calibration N] [--max-flip-rate R]
+        [--max-mean-drift D] [--output PATH]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The FP32 model is always the reference, whatever the worker is set to
+os.environ["MODEL_VARIANT"] = "fp32"
+
+import onnxruntime as ort  # noqa: E402
+from onnxruntime.quantization import (  # noqa: E402
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process  # noqa: E402
+
+from common import collect_images  # noqa: E402
+from workers import prediction  # noqa: E402
+from workers.preprocessing import preprocess_image  # noqa: E402
+
+# Probabilities this close to the threshold count as "near threshold"
+NEAR_THRESHOLD_BAND = 0.05
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """
+    Feeds preprocessed images to the calibrator one at a time.
+    """
+
+    def __init__(self, input_name: str, images):
+        self._feeds = iter([{input_name: image[None]} for image in images])
+
+    def get_next(self):
+        return next(self._feeds, None)
+
+
+def quantize(mode: str, calibration, output: Path, calibrate_method: str):
+    if mode == "dynamic":
+        quantize_dynamic(
+            str(prediction.MODEL_VARIANTS["fp32"]),
+            str(output),
+            weight_type=QuantType.QInt8
+        )
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference + graph cleanup first, as ORT recommends for static quantization
+        prepared = Path(tmp) / "prepared.onnx"
+        quant_pre_process(str(prediction.MODEL_VARIANTS["fp32"]), str(prepared))
+
+        quantize_static(
+            str(prepared),
+            str(output),
+            ImageCalibrationReader(prediction.load_model().input_name, calibration),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method={
+                "minmax": CalibrationMethod.MinMax,
+                "entropy": CalibrationMethod.Entropy,
+                "percentile": CalibrationMethod.Percentile,
+            }[calibrate_method]
+        )
+
+
+def load_session(path: Path) -> ort.InferenceSession:
+    # Same threading / arena settings as the worker
+    return ort.InferenceSession(
+        str(path),
+        sess_options=prediction.session_options(),
+        providers=["CPUExecutionProvider"]
+    )
+
+
+def predict(session, images, batch_size: int) -> np.ndarray:
+    model = prediction.load_model()
+    probs = []
+    for start in range(0, len(images), batch_size):
+        batch = np.stack(images[start:start + batch_size])
+        probs.append(session.run([model.output_name], {model.input_name: batch})[0][:, 0])
+    return np.concatenate(probs)
+
+
+def benchmark(session, image, batch_size: int, repeat: int):
+    """
+    Median latency (ms) of one call and throughput (images / s) at batch_size.
+    """
+    model = prediction.load_model()
+    batch = np.repeat(image[None], batch_size, axis=0)
+    feed = {model.input_name: batch}
+    session.run([model.output_name], feed)  # warm-up
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        session.run([model.output_name], feed)
+        timings.append(time.perf_counter() - start)
+
+    latency = float(np.median(timings))
+    return latency * 1000, batch_size / latency
+
+
+def main(args) -> int:
+    paths = list(collect_images(args.images))
+    if not paths:
+        print("No images found")
+        return 2
+
+    images = [preprocess_image(path.read_bytes()) for path in paths]
+
+    # Calibrate on the first images, judge on the rest (all of them if too few)
+    calibration = images[:args.calibration]
+    evaluation = images[args.calibration:] or images
+    if evaluation is images:
+        print(f"⚠️ Only {len(images)} images: evaluating on the calibration set")
+
+    output = Path(args.output)
+    print(f"🔄 Quantizing ({args.mode}) with {len(calibration)} calibration images...")
+    quantize(args.mode, calibration, output, args.calibrate_method)
+    print(f"💾 Wrote {output} ({output.stat().st_size / 1e6:.1f} MB, "
+          f"FP32 {prediction.MODEL_VARIANTS['fp32'].stat().st_size / 1e6:.1f} MB)")
+
+    fp32 = load_session(prediction.MODEL_VARIANTS["fp32"])
+    int8 = load_session(output)
+
+    # ---------- SPEED ----------
+    print("\nVariant  batch  latency ms  images/s")
+    speed = {}
+    for name, session in (("fp32", fp32), ("int8", int8)):
+        for batch_size in (1, prediction.MAX_BATCH_SIZE):
+            latency, throughput = benchmark(session, images[0], batch_size, args.repeat)
+            speed[name, batch_size] = throughput
+            print(f"{name:7}  {batch_size:5}  {latency:10.2f}  {throughput:8.1f}")
+
+    speedup = speed["int8", prediction.MAX_BATCH_SIZE] / speed["fp32", prediction.MAX_BATCH_SIZE]
+
+    # ---------- AGREEMENT ----------
+    threshold = prediction.THRESHOLD
+    reference = predict(fp32, evaluation, prediction.MAX_BATCH_SIZE)
+    quantized = predict(int8, evaluation, prediction.MAX_BATCH_SIZE)
+
+    drift = np.abs(quantized - reference)
+    flips = (reference >= threshold) != (quantized >= threshold)
+    near = np.abs(reference - threshold) <= NEAR_THRESHOLD_BAND
+
+    flip_rate = float(flips.mean())
+    near_flip_rate = float(flips[near].mean()) if near.any() else 0.0
+
+    print(f"\nEvaluation images: {len(evaluation)}  threshold={threshold:.2f}")
+    print(f"|Δp| mean={drift.mean():.4f}  max={drift.max():.4f}")
+    print(f"Label flips: {int(flips.sum())} ({flip_rate:.2%}); "
+          f"within ±{NEAR_THRESHOLD_BAND} of the threshold: "
+          f"{int(flips[near].sum())}/{int(near.sum())} ({near_flip_rate:.2%})")
+    print(f"Throughput at batch {prediction.MAX_BATCH_SIZE}: {speedup:.2f}x FP32")
+    if speedup < 1.2:
+        print("⚠️ INT8 is barely faster on this host (no VNNI / AVX512 or a small model?)")
+
+    within_budget = flip_rate <= args.max_flip_rate and drift.mean() <= args.max_mean_drift
+    if within_budget:
+        print(f"\n✅ Within budget (flip rate ≤ {args.max_flip_rate:.2%}, "
+              f"mean |Δp| ≤ {args.max_mean_drift}); MODEL_VARIANT=int8 can be used")
+        return 0
+
+    print(f"\n⛔ Over budget (flip rate ≤ {args.max_flip_rate:.2%}, "
+          f"mean |Δp| ≤ {args.max_mean_drift}); keep MODEL_VARIANT=fp32")
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="image files or directories")
+    parser.add_argument("--mode", choices=("static", "dynamic"), default="static")
+    parser.add_argument("--calibrate-method", choices=("minmax", "entropy", "percentile"), default="minmax")
+    parser.add_argument("--calibration", type=int, default=100, help="images used for calibration")
+    parser.add_argument("--max-flip-rate", type=float, default=0.01, help="allowed share of flipped labels")
+    parser.add_argument("--max-mean-drift", type=float, default=0.02, help="allowed mean |Δ probability|")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--output", default=str(prediction.MODEL_VARIANTS["int8"]))
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Simulates the job queue under mixed load and compares queue waits of
+FIFO claiming with the fair scheduler (job_storage.job_scheduler).
+
+One heavy user submits a burst of large jobs while other users keep
+sending small ones. Workers take one job at a time; a job runs for its
+estimated cost (job_cost) with some noise.
+
+Usage:
+    python tools/scheduler_simulation.py [--workers N] [--heavy-jobs N]
+        [--heavy-images N] [--small-rate R] [--duration S] [--seed N]
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The scheduler module only needs a Mongo URL to import; nothing connects
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+from job_storage.job_scheduler import (  # noqa: E402
+    FAST,
+    STANDARD,
+    job_cost,
+    lane_for,
+    next_finish,
+    schedule_key,
+)
+
+
+def workload(args, rng: random.Random):
+    """
+    (arrival, user, total_images) for every job, in arrival order.
+    """
+    jobs = [(i * 0.5, "heavy", args.heavy_images) for i in range(args.heavy_jobs)]
+
+    t = 0.0
+    while True:
+        t += rng.expovariate(args.small_rate)
+        if t > args.duration:
+            break
+        jobs.append((t, f"user{rng.randrange(args.small_users)}", rng.randint(1, 5)))
+
+    return sorted(jobs)
+
+
+def simulate(jobs, workers: int, fair: bool, rng: random.Random):
+    """
+    Returns {lane: [queue wait, ...]}.
+    """
+    finishes = {}
+    queue = []  # (key, arrival, seq, lane, runtime)
+    free_at = [0.0] * workers
+    waits = {FAST: [], STANDARD: []}
+    pending = list(jobs)
+    seq = 0
+
+    while pending or queue:
+        # Next worker to free up takes the best queued job at that moment
+        now = heapq.heappop(free_at)
+
+        while pending and (pending[0][0] <= now or not queue):
+            arrival, user, images = pending.pop(0)
+            lane = lane_for(images)
+
+            if fair:
+                finishes[user] = next_finish(finishes.get(user), arrival, images)
+                key = schedule_key(finishes[user], lane)
+            else:
+                key = arrival
+
+            runtime = job_cost(images) * rng.uniform(0.8, 1.2)
+            heapq.heappush(queue, (key, arrival, seq, lane, runtime))
+            seq += 1
+
+        key, arrival, _, lane, runtime = heapq.heappop(queue)
+        start = max(now, arrival)
+        waits[lane].append(start - arrival)
+        heapq.heappush(free_at, start + runtime)
+
+    return waits
+
+
+def describe(waits) -> str:
+    if not waits:
+        return "no jobs"
+    p50, p95 = np.percentile(waits, [50, 95])
+    return f"{len(waits):5} jobs  p50 {p50:7.1f} s  p95 {p95:7.1f} s  max {max(waits):7.1f} s"
+
+
+def main(args) -> int:
+    jobs = workload(args, random.Random(args.seed))
+
+    print(f"{len(jobs)} jobs, {args.workers} workers, "
+          f"{args.heavy_jobs} x {args.heavy_images}-image jobs from one user\n")
+
+    for name, fair in (("FIFO", False), ("fair", True)):
+        waits = simulate(jobs, args.workers, fair, random.Random(args.seed))
+        print(f"{name:5} fast lane     {describe(waits[FAST])}")
+        print(f"{name:5} standard lane {describe(waits[STANDARD])}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--heavy-jobs", type=int, default=20)
+    parser.add_argument("--heavy-images", type=int, default=100)
+    parser.add_argument("--small-users", type=int, default=20)
+    parser.add_argument("--small-rate", type=float, default=0.2, help="small jobs per second")
+    parser.add_argument("--duration", type=float, default=600, help="seconds of arrivals")
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main(parser.parse_args()))
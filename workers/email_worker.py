@@ -1,48 +1,232 @@
+import asyncio
 import os
+import time
+import traceback
+from typing import List
+
 import resend
 from dotenv import load_dotenv
 
+from job_storage import email_outbox
+import metrics
+
 load_dotenv()
 resend.api_key = os.getenv("RESEND_API_KEY")
 
-def send_report_email(user_email: str, user_id: str, report_link: str):
+# ---------- CONFIG ----------
+# "resend" sends for real; "local" keeps messages in memory (tests / dev)
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "resend")
+
+# Messages per provider call (Resend batch API accepts up to 100)
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+
+# Provider calls per second (Resend's default limit is 2)
+EMAIL_RATE_PER_SECOND = float(os.getenv("EMAIL_RATE_PER_SECOND", "2"))
+
+# Failed sends are retried with exponential backoff, then given up
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_BACKOFF_SECONDS = float(os.getenv("EMAIL_BACKOFF_SECONDS", "5"))
+EMAIL_BACKOFF_MAX_SECONDS = float(os.getenv("EMAIL_BACKOFF_MAX_SECONDS", "3600"))
+
+# How often the outbox is checked when nothing was queued in this process
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "10"))
+
+# A claimed batch is locked this long (covers a slow provider call)
+EMAIL_LOCK_SECONDS = float(os.getenv("EMAIL_LOCK_SECONDS", "120"))
+
+SENDER = "AI Image Detection <onboarding@resend.dev>"
+
+
+def report_email(user_email: str, user_id: str, report_link: str) -> dict:
+    """
+    Resend message for a finished report.
+    """
+    return {
+        "from": SENDER,
+        "to": [user_email],
+        "subject": "Your AI Image Detection Report is Ready",
+        "html": f"""
+            <p>Hi <b>{user_id}</b>,</p>
+
+            <p>Your AI Image Detection report is ready.</p>
+
+            <p>
+                <a href="{report_link}" target="_blank">
+                    👉 Download your report
+                </a>
+            </p>
+
+            <p>
+                <i>
+                Disclaimer: This report was generated using an AI-based system
+                and may contain inaccuracies.
+                </i>
+            </p>
+
+            <p>Thanks,<br/>AI Image Detection Team</p>
+        """
+    }
+
+
+# =========================
+# Transports
+# =========================
+class ResendTransport:
+    def send_batch(self, messages: List[dict]):
+        if not resend.api_key:
+            raise RuntimeError("RESEND_API_KEY not configured")
+
+        if len(messages) == 1:
+            resend.Emails.send(messages[0])
+        else:
+            resend.Batch.send(messages)
+
+
+class LocalTransport:
     """
-    Sends report download link to the user via Resend.
-    Returns 200 on success.
+    Stand-in for tests and local runs: records messages instead of
+    sending them. Set fail_next to make the next calls raise; a call
+    containing an address in rejected fails as a whole, like a Resend
+    batch with an invalid recipient.
     """
 
-    if not resend.api_key:
-        raise RuntimeError("RESEND_API_KEY not configured")
+    def __init__(self):
+        self.sent: List[dict] = []
+        self.calls = 0
+        self.fail_next = 0
+        self.rejected = set()
+
+    def send_batch(self, messages: List[dict]):
+        self.calls += 1
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise RuntimeError("LocalTransport: simulated provider failure")
+
+        for message in messages:
+            bad = self.rejected.intersection(message["to"])
+            if bad:
+                raise ValueError(f"LocalTransport: invalid recipient {', '.join(sorted(bad))}")
 
-    try:
-        resend.Emails.send({
-            "from": "AI Image Detection <onboarding@resend.dev>",
-            "to": [user_email],
-            "subject": "Your AI Image Detection Report is Ready",
-            "html": f"""
-                <p>Hi <b>{user_id}</b>,</p>
+        self.sent.extend(messages)
+        for message in messages:
+            print(f"📧 [local] {message['subject']} → {', '.join(message['to'])}")
 
-                <p>Your AI Image Detection report is ready.</p>
 
-                <p>
-                    <a href="{report_link}" target="_blank">
-                        👉 Download your report
-                    </a>
-                </p>
+def get_transport():
+    if EMAIL_TRANSPORT == "local":
+        return LocalTransport()
+    return ResendTransport()
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1 / rate_per_second apart.
+    """
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1 / rate_per_second if rate_per_second > 0 else 0
+        self._next = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        wait = self._next - now
+        self._next = max(now, self._next) + self.interval
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(EMAIL_BACKOFF_SECONDS * 2 ** (attempts - 1), EMAIL_BACKOFF_MAX_SECONDS)
+
+
+# =========================
+# Sender
+# =========================
+async def _send(transport, limiter: RateLimiter, batch: List[dict]):
+    await limiter.acquire()
+    with metrics.stage("email").time():
+        await asyncio.to_thread(transport.send_batch, [doc["message"] for doc in batch])
+
+
+async def _record_failure(doc: dict, error: Exception):
+    attempts = doc.get("attempts", 0) + 1
+    await email_outbox.mark_failed_attempt(doc, str(error), backoff_seconds(attempts), EMAIL_MAX_ATTEMPTS)
+    metrics.EMAILS_TOTAL.labels(outcome="failed").inc()
+    if attempts >= EMAIL_MAX_ATTEMPTS:
+        print(f"⛔ Giving up on email for job {doc['_id']}")
+
+
+async def send_pending(transport=None, limiter: RateLimiter = None) -> int:
+    """
+    Sends every due outbox message in batches. Returns the number sent.
+
+    The batch API accepts or rejects a batch as a whole, so when a batch
+    fails its messages are sent one by one: only the bad ones are retried
+    (and eventually marked failed), the rest go out now.
+    """
+    transport = transport or get_transport()
+    limiter = limiter or RateLimiter(EMAIL_RATE_PER_SECOND)
+    sent = 0
+
+    while True:
+        batch = await email_outbox.claim_batch(EMAIL_BATCH_SIZE, EMAIL_LOCK_SECONDS)
+        if not batch:
+            return sent
+
+        try:
+            await _send(transport, limiter, batch)
+        except Exception as e:
+            print(f"⚠️ Email batch of {len(batch)} failed: {e}")
+            if len(batch) == 1:
+                await _record_failure(batch[0], e)
+                return sent
+
+            delivered = []
+            for doc in batch:
+                try:
+                    await _send(transport, limiter, [doc])
+                except Exception as error:
+                    await _record_failure(doc, error)
+                else:
+                    delivered.append(doc["_id"])
+
+            await email_outbox.mark_sent(delivered)
+            metrics.EMAILS_TOTAL.labels(outcome="sent").inc(len(delivered))
+            sent += len(delivered)
+            print(f"📧 Sent {len(delivered)}/{len(batch)} report email(s) one by one")
+
+            if not delivered:
+                # The provider is struggling; leave the rest for the next round
+                return sent
+            continue
+
+        await email_outbox.mark_sent([doc["_id"] for doc in batch])
+        metrics.EMAILS_TOTAL.labels(outcome="sent").inc(len(batch))
+        sent += len(batch)
+        print(f"📧 Sent {len(batch)} report email(s)")
+
+
+async def run_email_sender(transport=None):
+    """
+    Drains the outbox until cancelled. Wakes immediately when a job in
+    this process queues an email, and polls for the rest.
+    """
+    transport = transport or get_transport()
+    limiter = RateLimiter(EMAIL_RATE_PER_SECOND)
 
-                <p>
-                    <i>
-                    Disclaimer: This report was generated using an AI-based system
-                    and may contain inaccuracies.
-                    </i>
-                </p>
+    while True:
+        try:
+            await send_pending(transport, limiter)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            print("⚠️ Email sender error")
+            print(traceback.format_exc())
 
-                <p>Thanks,<br/>AI Image Detection Team</p>
-            """
-        })
+        await email_outbox.wait_for_message(EMAIL_POLL_SECONDS)
 
-        return 200
 
-    except Exception as e:
-        print(f"Resend email failed: {e}")
-        raise
+if __name__ == "__main__":
+    metrics.start_worker_metrics_server()
+    asyncio.run(run_email_sender())
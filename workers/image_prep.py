@@ -1,32 +1,24 @@
-import tensorflow as tf
-from supabase_client.supabase_init import supabase_admin
+from supabase_client.supabase_init import get_async_admin
+from workers.preprocessing import preprocess_image, preprocess_with_thumbnail
 
-IMG_SIZE = (224, 224)
 
-def load_image(bucket_name: str, file_path: str):
+async def download_image(bucket_name: str, file_path: str) -> bytes:
     """
-    bucket_name: Supabase storage bucket (e.g. 'avatars')
-    file_path: path inside bucket (e.g. 'folder/avatar1.png')
+    Downloads raw image bytes from Supabase storage, over the shared
+    async admin client's connection pool.
     """
-
-    # Download image bytes from Supabase
-    image_bytes = (
+    supabase_admin = await get_async_admin()
+    return await (
         supabase_admin
         .storage
         .from_(bucket_name)
         .download(file_path)
     )
 
-    # Decode image from bytes
-    image = tf.image.decode_image(
-        image_bytes,
-        channels=3,
-        expand_animations=False
-    )
-
-    # Resize and normalize
-    image = tf.image.resize(image, IMG_SIZE)
-    image = tf.cast(image, tf.float32) / 255.0
-
-    return image
 
+async def load_image(bucket_name: str, file_path: str):
+    """
+    bucket_name: Supabase storage bucket (e.g. 'avatars')
+    file_path: path inside bucket (e.g. 'folder/avatar1.png')
+    """
+    return preprocess_image(await download_image(bucket_name, file_path))
@@ -1,7 +1,13 @@
+import asyncio
 import io
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from reportlab.graphics.shapes import Circle, Drawing, String, Wedge
+from reportlab.lib import colors
 
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
@@ -15,53 +21,163 @@ from reportlab.platypus import (
     TableStyle
 )
 
+# Image rows laid out per chunk while building the PDF
+REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", "20"))
+
+# Processes rendering reports, and how long one render may take
+REPORT_PROCESSES = int(os.getenv("REPORT_PROCESSES", "1"))
+REPORT_TIMEOUT_SECONDS = float(os.getenv("REPORT_TIMEOUT_SECONDS", "300"))
+
+# Built once and shared by every report
+STYLES = getSampleStyleSheet()
+
+PIE_LABELS = ("AI Generated", "Real")
+PIE_COLORS = (colors.HexColor("#ff6b6b"), colors.HexColor("#4ecdc4"))
+
+ROW_STYLE = TableStyle([
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("LEFTPADDING", (0, 0), (-1, -1), 10),
+    ("RIGHTPADDING", (0, 0), (-1, -1), 10),
+])
 
 
 def calculate_ai_percentage(results):
-    ai_count = sum(1 for r in results if r["prediction"] == "AI Generated")
+    ai_count = sum(1 for r in results if r.prediction == "AI Generated")
     total = len(results)
     return round((ai_count / total) * 100, 2)
 
-def generate_pie_chart(ai_percentage):
+def generate_pie_chart(ai_percentage, size=3 * inch):
+    """
+    AI vs Real pie chart as vector ReportLab graphics (no rasterizing).
+    Slices start at 12 o'clock and run anticlockwise.
+    """
     human_percentage = 100 - ai_percentage
 
-    fig, ax = plt.subplots(figsize=(4, 4))
-    ax.pie(
-        [ai_percentage, human_percentage],
-        labels=["AI Generated", "Real"],
-        autopct="%1.1f%%",
-        startangle=90,
-        colors=["#ff6b6b", "#4ecdc4"]
-    )
-    ax.set_title("AI vs Real Image Distribution")
+    drawing = Drawing(size, size)
+    drawing.hAlign = "CENTER"
+    drawing.add(String(
+        size / 2, size - 14,
+        "AI vs Real Image Distribution",
+        fontName="Helvetica", fontSize=11, textAnchor="middle"
+    ))
+
+    cx, cy = size / 2, (size - 18) / 2
+    radius = size * 0.33
+    angle = 90.0
+
+    for label, value, color in zip(PIE_LABELS, (ai_percentage, human_percentage), PIE_COLORS):
+        if value <= 0:
+            continue
+
+        sweep = 360.0 * value / 100
+        if sweep >= 360:
+            drawing.add(Circle(cx, cy, radius, fillColor=color, strokeColor=None))
+        else:
+            drawing.add(Wedge(cx, cy, radius, angle, angle + sweep, fillColor=color, strokeColor=None))
+
+        mid = math.radians(angle + sweep / 2)
+        for text, distance in ((label, 1.15), (f"{value:.1f}%", 0.6)):
+            x = cx + math.cos(mid) * radius * distance
+            y = cy + math.sin(mid) * radius * distance - 3
+            anchor = "middle" if distance < 1 or abs(math.cos(mid)) < 0.2 else ("start" if math.cos(mid) > 0 else "end")
+            drawing.add(String(x, y, text, fontName="Helvetica", fontSize=9, textAnchor=anchor))
+
+        angle += sweep
+
+    return drawing
+
+
+def _image_flowables(rows, chunk_size):
+    """
+    Yields the per-image flowables chunk_size rows at a time, so only
+    the current chunk's flowables exist while the PDF is being laid out.
+    """
+    for start in range(0, len(rows), chunk_size):
+        chunk = []
+
+        for idx, r in enumerate(rows[start:start + chunk_size], start=start + 1):
+            # JPEG thumbnail is embedded in the PDF as-is, without re-encoding;
+            # results without one (e.g. restored from an old checkpoint) get an empty cell
+            img = ""
+            if r.thumbnail:
+                img = RLImage(io.BytesIO(r.thumbnail), width=2.5 * inch, height=2.5 * inch)
+
+            info = Paragraph(
+                f"""
+                <b>Image {idx}</b><br/>
+                Prediction: <b>{r.prediction}</b><br/>
+                Confidence: <b>{r.confidence}%</b>
+                """,
+                STYLES["Normal"]
+            )
 
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format="png", bbox_inches="tight")
-    plt.close(fig)
-    buffer.seek(0)
+            table = Table(
+                [[img, info]],
+                colWidths=[3 * inch, 3 * inch]
+            )
 
-    return buffer
+            table.setStyle(ROW_STYLE)
 
-def tensor_to_rl_image(tensor, width=2.5 * inch):
+            chunk.append(table)
+            chunk.append(Spacer(1, 18))
+
+        yield chunk
+
+
+class _ChunkedDocTemplate(SimpleDocTemplate):
     """
-    Converts TF tensor (224,224,3) → ReportLab Image
+    Pulls flowables from a generator while the document is being built
+    instead of taking them all up front.
     """
-    img_np = (tensor.numpy() * 255).astype(np.uint8)
-    pil_img = Image.fromarray(img_np)
 
-    buffer = io.BytesIO()
-    pil_img.save(buffer, format="PNG")
-    buffer.seek(0)
+    def __init__(self, output, chunks, tail, **kwargs):
+        super().__init__(output, **kwargs)
+        self._chunks = chunks
+        self._tail = tail
+        self._story = None
+
+    def build(self, flowables, **kwargs):
+        self._story = flowables
+        super().build(flowables, **kwargs)
 
-    return RLImage(buffer, width=width, height=width)
+    def filterFlowables(self, flowables):
+        # Also called for internal lists (e.g. hanging page headers);
+        # only the main story is refilled, before build() sees it empty.
+        if flowables is not self._story or self._chunks is None:
+            return
 
-def create_pdf_report(results, output_path="report.pdf"):
+        if len(flowables) <= 2:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                flowables.extend(self._tail)
+                self._chunks = None
+            else:
+                flowables.extend(chunk)
+
+
+def build_pdf(rows) -> bytes:
     """
-    results: output from predict_batch
+    rows: ImageResult list with JPEG thumbnails
+    Returns the PDF as bytes; nothing is written to disk.
     """
+    output = io.BytesIO()
+    styles = STYLES
+
+    # ===== DISCLAIMER =====
+    tail = [
+        Spacer(1, 24),
+        Paragraph(
+            "<i>Disclaimer: These images were analyzed using an AI-based system. "
+            "AI predictions are probabilistic and may contain inaccuracies. "
+            "This report should not be considered as definitive proof.</i>",
+            styles["Italic"]
+        )
+    ]
 
-    doc = SimpleDocTemplate(
-        output_path,
+    doc = _ChunkedDocTemplate(
+        output,
+        chunks=_image_flowables(rows, REPORT_CHUNK_SIZE),
+        tail=tail,
         pagesize=A4,
         rightMargin=36,
         leftMargin=36,
@@ -69,7 +185,6 @@ def create_pdf_report(results, output_path="report.pdf"):
         bottomMargin=36
     )
 
-    styles = getSampleStyleSheet()
     elements = []
 
     # ===== TITLE =====
@@ -79,7 +194,7 @@ def create_pdf_report(results, output_path="report.pdf"):
     elements.append(Spacer(1, 12))
 
     # ===== AI PERCENTAGE =====
-    ai_percentage = calculate_ai_percentage(results)
+    ai_percentage = calculate_ai_percentage(rows)
 
     elements.append(
         Paragraph(
@@ -90,8 +205,7 @@ def create_pdf_report(results, output_path="report.pdf"):
     elements.append(Spacer(1, 12))
 
     # ===== PIE CHART =====
-    pie_chart = generate_pie_chart(ai_percentage)
-    elements.append(RLImage(pie_chart, width=3 * inch, height=3 * inch))
+    elements.append(generate_pie_chart(ai_percentage))
     elements.append(Spacer(1, 24))
 
     # ===== IMAGE RESULTS =====
@@ -100,44 +214,69 @@ def create_pdf_report(results, output_path="report.pdf"):
     )
     elements.append(Spacer(1, 12))
 
-    for idx, r in enumerate(results, start=1):
-        img = tensor_to_rl_image(r["image_tensor"])
+    # ===== BUILD PDF =====
+    # Image rows and the disclaimer are pulled in by _ChunkedDocTemplate
+    doc.build(elements)
 
-        info = Paragraph(
-            f"""
-            <b>Image {idx}</b><br/>
-            Prediction: <b>{r["prediction"]}</b><br/>
-            Confidence: <b>{r["confidence"]}%</b>
-            """,
-            styles["Normal"]
-        )
+    return output.getvalue()
 
-        table = Table(
-            [[img, info]],
-            colWidths=[3 * inch, 3 * inch]
-        )
 
-        table.setStyle(
-            TableStyle([
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("LEFTPADDING", (0, 0), (-1, -1), 10),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 10),
-            ])
-        )
+def create_pdf_report(results) -> bytes:
+    """
+    results: ImageResult list (see run_image_pipeline / predict_batch)
+    Renders in the calling thread; see render_pdf_report for the
+    process-pool version used by the worker.
+    """
+    return build_pdf(results)
 
-        elements.append(table)
-        elements.append(Spacer(1, 18))
 
-    # ===== DISCLAIMER =====
-    elements.append(Spacer(1, 24))
-    elements.append(
-        Paragraph(
-            "<i>Disclaimer: These images were analyzed using an AI-based system. "
-            "AI predictions are probabilistic and may contain inaccuracies. "
-            "This report should not be considered as definitive proof.</i>",
-            styles["Italic"]
+# =========================
+# Process Pool Rendering
+# =========================
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: never fork a process that is running ONNX / Mongo threads
+        _pool = ProcessPoolExecutor(
+            max_workers=REPORT_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn")
         )
-    )
+    return _pool
 
-    # ===== BUILD PDF =====
-    doc.build(elements)
+
+def _reset_pool():
+    """
+    Kills the pool's processes (e.g. a render that hit the timeout).
+    """
+    global _pool
+    if _pool is None:
+        return
+
+    pool, _pool = _pool, None
+    for process in list(getattr(pool, "_processes", {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def render_pdf_report(results, timeout: float = REPORT_TIMEOUT_SECONDS) -> bytes:
+    """
+    Renders the report in a worker process so the event loop (heartbeats,
+    Mongo calls) keeps running. Raises RuntimeError on timeout or crash.
+    """
+    loop = asyncio.get_running_loop()
+
+    try:
+        # ImageResults are already compact; they are pickled to the child as-is
+        return await asyncio.wait_for(
+            loop.run_in_executor(_get_pool(), build_pdf, results),
+            timeout
+        )
+    except asyncio.TimeoutError as e:
+        _reset_pool()
+        raise RuntimeError(f"[REPORT RENDER FAILED] timed out after {timeout}s") from e
+    except BrokenProcessPool as e:
+        _reset_pool()
+        raise RuntimeError(f"[REPORT RENDER FAILED] {str(e)}") from e
@@ -0,0 +1,188 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional
+
+import metrics
+from workers import image_prep, prediction, prediction_cache
+
+# ---------- CONFIG ----------
+# Concurrent storage downloads per job
+DOWNLOAD_CONCURRENCY = int(os.getenv("PIPELINE_DOWNLOAD_CONCURRENCY", "8"))
+
+# Threads decoding / resizing images per job
+DECODE_WORKERS = int(os.getenv("PIPELINE_DECODE_WORKERS", "4"))
+
+# Max items buffered between two stages (bounds prefetch and memory)
+QUEUE_DEPTH = int(os.getenv("PIPELINE_QUEUE_DEPTH", "32"))
+
+_DONE = object()
+
+
+# =========================
+# Stages
+# =========================
+async def _download_and_hash(bucket: str, path: str):
+    with metrics.stage("download").time():
+        image_bytes = await image_prep.download_image(bucket, path)
+    # Hashing a few MB is kept off the event loop
+    return image_bytes, await asyncio.to_thread(prediction_cache.cache_key, image_bytes)
+
+
+def _decode(image_bytes: bytes):
+    with metrics.stage("decode").time():
+        return image_prep.preprocess_with_thumbnail(image_bytes)
+
+
+async def _download_stage(work: asyncio.Queue, out: asyncio.Queue, bucket: str, input_prefix: str):
+    while True:
+        try:
+            idx, filename = work.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+
+        image_bytes, key = await _download_and_hash(bucket, f"{input_prefix}{filename}")
+        cached = await prediction_cache.lookup(key)
+        await out.put((idx, image_bytes, key, cached))
+
+
+async def _decode_stage(inp: asyncio.Queue, out: asyncio.Queue, pool: ThreadPoolExecutor):
+    loop = asyncio.get_running_loop()
+
+    while True:
+        item = await inp.get()
+        if item is _DONE:
+            return
+
+        idx, image_bytes, key, cached = item
+        image, thumbnail = await loop.run_in_executor(pool, _decode, image_bytes)
+        await out.put((idx, image, thumbnail, key, cached))
+
+
+async def _infer_stage(
+    inp: asyncio.Queue,
+    results: list,
+    fresh: list,
+    batcher: prediction.InferenceBatcher,
+    on_results: Optional[Callable[[list], Awaitable]] = None
+):
+    # batcher is FIFO, so pending entries line up with the results it returns
+    pending = []
+    unsaved = []
+
+    async def checkpoint(force=False):
+        nonlocal unsaved
+        if on_results is None or not unsaved:
+            return
+        if force or len(unsaved) >= batcher.max_batch_size:
+            entries, unsaved = unsaved, []
+            await on_results(entries)
+
+    async def collect(batch_results):
+        for result in batch_results:
+            idx, key = pending.pop(0)
+            results[idx] = result
+            fresh.append((key, result.probability))
+            unsaved.append((idx, result))
+
+        if batch_results:
+            await checkpoint(force=True)
+
+    while True:
+        timeout = batcher.max_wait if len(batcher) and batcher.max_wait > 0 else None
+
+        try:
+            item = await asyncio.wait_for(inp.get(), timeout)
+        except asyncio.TimeoutError:
+            await collect(await asyncio.to_thread(batcher.flush))
+            continue
+
+        if item is _DONE:
+            await collect(await asyncio.to_thread(batcher.flush))
+            await checkpoint(force=True)
+            return
+
+        idx, image, thumbnail, key, cached = item
+
+        # Cache hits skip ONNX entirely
+        if cached is not None:
+            results[idx] = prediction.to_result(cached, thumbnail, batcher.threshold)
+            unsaved.append((idx, results[idx]))
+            await checkpoint()
+            continue
+
+        pending.append((idx, key))
+        await collect(await asyncio.to_thread(batcher.add, image, thumbnail))
+
+
+async def _close_when_done(tasks, queue: asyncio.Queue, consumers: int):
+    await asyncio.gather(*tasks)
+    for _ in range(consumers):
+        await queue.put(_DONE)
+
+
+# =========================
+# Pipeline
+# =========================
+async def run_image_pipeline(
+    bucket: str,
+    input_prefix: str,
+    filenames: List[str],
+    download_concurrency: int = DOWNLOAD_CONCURRENCY,
+    decode_workers: int = DECODE_WORKERS,
+    queue_depth: int = QUEUE_DEPTH,
+    done: Optional[list] = None,
+    on_results: Optional[Callable[[list], Awaitable]] = None,
+) -> list:
+    """
+    Runs download → decode → infer as overlapping stages connected by
+    bounded queues. Images already in the prediction cache are not sent
+    to ONNX. Returns one ImageResult per filename, in order; decoded
+    tensors are dropped as soon as their batch has been inferred.
+
+    done: results from an earlier attempt (None for missing images);
+          those images are not downloaded again.
+    on_results: awaited with new (idx, ImageResult) pairs as batches
+                complete, so progress survives a crash.
+    """
+    results = list(done) if done else [None] * len(filenames)
+    fresh = []
+
+    work = asyncio.Queue()
+    for idx, filename in enumerate(filenames):
+        if results[idx] is None:
+            work.put_nowait((idx, filename))
+
+    if work.empty():
+        return results
+
+    decode_q = asyncio.Queue(maxsize=queue_depth)
+    infer_q = asyncio.Queue(maxsize=queue_depth)
+    batcher = prediction.InferenceBatcher()
+
+    with ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode") as pool:
+        downloaders = [
+            asyncio.create_task(_download_stage(work, decode_q, bucket, input_prefix))
+            for _ in range(min(download_concurrency, work.qsize()))
+        ]
+        decoders = [
+            asyncio.create_task(_decode_stage(decode_q, infer_q, pool))
+            for _ in range(decode_workers)
+        ]
+        tasks = downloaders + decoders + [
+            asyncio.create_task(_close_when_done(downloaders, decode_q, len(decoders))),
+            asyncio.create_task(_close_when_done(decoders, infer_q, 1)),
+            asyncio.create_task(_infer_stage(infer_q, results, fresh, batcher, on_results)),
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    await prediction_cache.store_many(fresh)
+
+    return results
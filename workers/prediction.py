@@ -1,60 +1,418 @@
+import hashlib
 import os
+import platform
+import threading
+import time
 from pathlib import Path
+from typing import Optional
 import numpy as np
 import onnxruntime as ort
+from workers.results import ImageResult
+import metrics
 
 # ---------- CONFIG ----------
-MODEL_PATH = Path("models") / "ai_vs_real_cnn_frozen.onnx"
+# "fp32" (reference) or "int8" (built by tools/quantize_model.py)
+MODEL_VARIANTS = {
+    "fp32": Path("models") / "ai_vs_real_cnn_frozen.onnx",
+    "int8": Path("models") / "ai_vs_real_cnn_frozen.int8.onnx",
+}
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "fp32")
 
-# ---------- LOAD ONNX MODEL (FAIL FAST) ----------
-if not MODEL_PATH.exists():
-    raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
+if MODEL_VARIANT not in MODEL_VARIANTS:
+    raise ValueError(f"MODEL_VARIANT must be one of {sorted(MODEL_VARIANTS)}")
 
-print("🔄 Loading ONNX model...")
+MODEL_PATH = MODEL_VARIANTS[MODEL_VARIANT]
 
-SESSION = ort.InferenceSession(
-    str(MODEL_PATH),
-    providers=["CPUExecutionProvider"]
+# Images at or above this probability are labelled "AI Generated"
+THRESHOLD = 0.40
+
+# Largest number of images sent to ONNX in a single SESSION.run
+MAX_BATCH_SIZE = int(os.getenv("PREDICTION_MAX_BATCH_SIZE", "16"))
+
+# Flush a partially filled batch once its oldest image has waited this long
+# (0 disables the deadline: batches only flush when full or at the end)
+MAX_BATCH_WAIT_MS = float(os.getenv("PREDICTION_MAX_BATCH_WAIT_MS", "0"))
+
+if MAX_BATCH_SIZE < 1:
+    raise ValueError("PREDICTION_MAX_BATCH_SIZE must be >= 1")
+
+# Partial batches are padded up to the nearest of these shapes so the
+# session only ever sees a small, fixed set of batch sizes.
+BATCH_SHAPES = sorted(
+    {min(2 ** i, MAX_BATCH_SIZE) for i in range(MAX_BATCH_SIZE.bit_length() + 1)}
 )
 
-INPUT_NAME = SESSION.get_inputs()[0].name
-OUTPUT_NAME = SESSION.get_outputs()[0].name
+# ---------- SESSION OPTIONS ----------
+# Threads per ONNX call (0 = one per physical core). With several workers
+# on a host, set intra-op threads to cores / workers to avoid oversubscription
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+
+# "sequential" or "parallel" (parallel only helps graphs with independent branches)
+ORT_EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential")
+
+# "disable", "basic", "extended" or "all"
+ORT_GRAPH_OPTIMIZATION = os.getenv("ORT_GRAPH_OPTIMIZATION", "all")
+
+# CPU memory arena and memory pattern planning (both on by default in ORT)
+ORT_CPU_MEM_ARENA = os.getenv("ORT_CPU_MEM_ARENA", "1") == "1"
+ORT_MEM_PATTERN = os.getenv("ORT_MEM_PATTERN", "1") == "1"
+
+# Optimized graphs are saved here and loaded on later starts ("" = off)
+ORT_OPTIMIZED_MODEL_DIR = os.getenv("ORT_OPTIMIZED_MODEL_DIR", str(Path("models") / "optimized"))
+
+# Run through preallocated input / output buffers per batch shape
+ORT_IO_BINDING = os.getenv("ORT_IO_BINDING", "1") == "1"
+
+_EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+if ORT_EXECUTION_MODE not in _EXECUTION_MODES:
+    raise ValueError(f"ORT_EXECUTION_MODE must be one of {sorted(_EXECUTION_MODES)}")
+
+if ORT_GRAPH_OPTIMIZATION not in _OPTIMIZATION_LEVELS:
+    raise ValueError(f"ORT_GRAPH_OPTIMIZATION must be one of {sorted(_OPTIMIZATION_LEVELS)}")
+
+# ---------- SESSION ----------
+
+def session_options(optimization_level=None) -> ort.SessionOptions:
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    options.execution_mode = _EXECUTION_MODES[ORT_EXECUTION_MODE]
+    options.graph_optimization_level = (
+        optimization_level
+        if optimization_level is not None
+        else _OPTIMIZATION_LEVELS[ORT_GRAPH_OPTIMIZATION]
+    )
+    options.enable_cpu_mem_arena = ORT_CPU_MEM_ARENA
+    options.enable_mem_pattern = ORT_MEM_PATTERN
+    return options
+
+
+# Level the cached graph is saved at. "all" adds layout transforms (NCHWc)
+# tuned to the CPU's instruction set (AVX2 / AVX-512), so a graph saved
+# there only suits hosts like the one that saved it; those transforms run
+# when the cached graph is loaded instead
+_SAVED_OPTIMIZATION = "extended" if ORT_GRAPH_OPTIMIZATION == "all" else ORT_GRAPH_OPTIMIZATION
+
+
+def optimized_model_path() -> Path:
+    """
+    Cache file for the optimized graph. An optimized graph is tied to the
+    weights, ORT version, optimization level and CPU architecture, so all
+    of them are part of the name.
+    """
+    return Path(ORT_OPTIMIZED_MODEL_DIR) / (
+        f"{MODEL_PATH.stem}-{model_version()}-ort{ort.__version__}"
+        f"-{_SAVED_OPTIMIZATION}-{platform.machine()}.onnx"
+    )
+
+
+def _save_optimized_model(cached: Path) -> bool:
+    options = session_options(_OPTIMIZATION_LEVELS[_SAVED_OPTIMIZATION])
+    tmp_path = cached.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        options.optimized_model_filepath = str(tmp_path)
+    except OSError as e:
+        print(f"⚠️ Optimized model cache disabled: {e}")
+        return False
+
+    ort.InferenceSession(str(MODEL_PATH), sess_options=options, providers=["CPUExecutionProvider"])
+
+    # Renamed into place, so concurrent starts never load a half-written file
+    if not tmp_path.exists():
+        return False
+    os.replace(tmp_path, cached)
+    print(f"💾 Saved optimized model to {cached}")
+    return True
+
+
+def _load_optimized_model(cached: Path) -> Optional[ort.InferenceSession]:
+    # Only the hardware-specific "all" passes are left to run at load time
+    level = (
+        ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ORT_GRAPH_OPTIMIZATION == "all"
+        else ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    )
+    try:
+        session = ort.InferenceSession(
+            str(cached),
+            sess_options=session_options(level),
+            providers=["CPUExecutionProvider"]
+        )
+    except Exception as e:
+        print(f"⚠️ Optimized model cache unusable ({e}), rebuilding")
+        return None
+
+    print(f"⚡ Loaded optimized model from {cached}")
+    return session
+
+
+def create_session() -> ort.InferenceSession:
+    """
+    Loads the cached optimized graph, optimizing MODEL_PATH and saving the
+    result first if there is none (or it is unusable).
+    """
+    if ORT_OPTIMIZED_MODEL_DIR and ORT_GRAPH_OPTIMIZATION != "disable":
+        cached = optimized_model_path()
+
+        session = _load_optimized_model(cached) if cached.exists() else None
+        if session is None and _save_optimized_model(cached):
+            session = _load_optimized_model(cached)
+        if session is not None:
+            return session
+
+    return ort.InferenceSession(
+        str(MODEL_PATH),
+        sess_options=session_options(),
+        providers=["CPUExecutionProvider"]
+    )
+
+
+# ---------- IO BINDING ----------
+class _BoundShape:
+    """
+    Input and output buffers for one batch shape, bound once. A run copies
+    images into the input buffer and reads probabilities from the output
+    buffer, so the session allocates neither.
+    """
+
+    def __init__(self, model: "LoadedModel", size: int, output_shape):
+        self.lock = threading.Lock()
+        self.session = model.session
+        self.batch = np.zeros((size, 224, 224, 3), dtype=np.float32)
+        self.output = np.zeros(output_shape, dtype=np.float32)
+
+        self.binding = model.session.io_binding()
+        self.binding.bind_ortvalue_input(model.input_name, ort.OrtValue.ortvalue_from_numpy(self.batch))
+        self.binding.bind_ortvalue_output(model.output_name, ort.OrtValue.ortvalue_from_numpy(self.output))
+
+    def run(self):
+        self.session.run_with_iobinding(self.binding)
+        return self.output
+
+
+# ---------- MODEL (LOADED ON FIRST USE) ----------
+class LoadedModel:
+    def __init__(self, session: ort.InferenceSession):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.output_name = session.get_outputs()[0].name
+        self.bound_shapes = {}
+
+
+_model = None
+_model_version = None
+_model_lock = threading.Lock()
+
 
-# ---------- STARTUP SANITY CHECK ----------
-_dummy = np.zeros((2, 224, 224, 3), dtype=np.float32)
-SESSION.run([OUTPUT_NAME], {INPUT_NAME: _dummy})
+def model_version() -> str:
+    """
+    Identifies the weights in use; part of every prediction cache key.
+    """
+    global _model_version
+    if _model_version is None:
+        _model_version = (
+            os.getenv("MODEL_VERSION")
+            or hashlib.sha256(MODEL_PATH.read_bytes()).hexdigest()[:16]
+        )
+    return _model_version
+
+
+def load_model() -> LoadedModel:
+    """
+    Creates the session and runs every batch shape once (fail fast on a
+    broken model). Nothing is loaded at import time, so importing this
+    module stays cheap; the worker calls this at startup and later calls
+    return the same model.
+    """
+    global _model
+    if _model is not None:
+        return _model
+
+    with _model_lock:
+        if _model is not None:
+            return _model
+
+        if not MODEL_PATH.exists():
+            raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
+
+        print(f"🔄 Loading ONNX model ({MODEL_VARIANT})...")
+        model = LoadedModel(create_session())
+
+        # ---------- STARTUP SANITY CHECK ----------
+        for size in BATCH_SHAPES:
+            dummy = np.zeros((size, 224, 224, 3), dtype=np.float32)
+            probs = model.session.run([model.output_name], {model.input_name: dummy})[0]
+
+            if ORT_IO_BINDING:
+                model.bound_shapes[size] = _BoundShape(model, size, probs.shape)
+
+        print(
+            f"✅ ONNX model loaded and verified (batch shapes: {BATCH_SHAPES}, "
+            f"intra-op threads: {ORT_INTRA_OP_THREADS or 'auto'}, io binding: {ORT_IO_BINDING})"
+        )
+
+        _model = model
+        return _model
+
+
+def get_session() -> ort.InferenceSession:
+    return load_model().session
 
-print("✅ ONNX model loaded and verified")
 
 # ---------- HELPERS ----------
 def ensure_valid_batch(images):
-    if not (1 <= len(images) <= 2):
-        raise ValueError("Batch must contain 1 or 2 images.")
+    if not (1 <= len(images) <= MAX_BATCH_SIZE):
+        raise ValueError(f"Batch must contain 1 to {MAX_BATCH_SIZE} images.")
 
-# ---------- PREDICTION ----------
-def predict_batch(images, threshold=0.40):
+
+def padded_batch_size(n: int) -> int:
     """
-    images: list of 1 or 2 NumPy arrays, each (224, 224, 3)
+    Smallest configured batch shape that fits n images.
+    """
+    for size in BATCH_SHAPES:
+        if size >= n:
+            return size
+    return MAX_BATCH_SIZE
+
+
+def run_session(images) -> np.ndarray:
+    """
+    Runs a single ONNX call and returns one probability per image.
+    images: list of 1..MAX_BATCH_SIZE arrays, each (224, 224, 3)
     """
     ensure_valid_batch(images)
 
-    batch = np.stack(images, axis=0).astype(np.float32)
+    model = load_model()
+    n = len(images)
+    size = padded_batch_size(n)
+    bound = model.bound_shapes.get(size)
 
-    probs = SESSION.run(
-        [OUTPUT_NAME],
-        {INPUT_NAME: batch}
-    )[0]  # shape: (B, 1)
+    if bound is not None:
+        with bound.lock:
+            # Padding rows keep stale images; their outputs are dropped
+            for i, image in enumerate(images):
+                bound.batch[i] = image
 
-    results = []
-    for i, prob in enumerate(probs):
-        p = float(prob[0])
+            with metrics.stage("inference_batch").time():
+                probs = bound.run()  # shape: (size, 1)
+
+            # Copied out: the buffer is reused by the next batch
+            probs = probs[:n, 0].copy()  # shape: (n,)
+    else:
+        batch = np.zeros((size, 224, 224, 3), dtype=np.float32)
+        for i, image in enumerate(images):
+            batch[i] = image
 
-        label = "AI Generated" if p >= threshold else "Real"
-        confidence = p if p >= threshold else 1 - p
+        with metrics.stage("inference_batch").time():
+            probs = model.session.run(
+                [model.output_name],
+                {model.input_name: batch}
+            )[0][:n, 0]  # (size, 1) output → shape: (n,)
 
-        results.append({
-            "prediction": label,
-            "confidence": round(confidence * 100, 2),
-            "image_tensor": images[i]
-        })
+    metrics.INFERENCE_BATCH_SIZE.observe(n)
+    return probs
+
+# ---------- PREDICTION ----------
+def to_result(prob: float, thumbnail=None, threshold=THRESHOLD) -> ImageResult:
+    p = float(prob)
+
+    label = "AI Generated" if p >= threshold else "Real"
+    confidence = p if p >= threshold else 1 - p
+
+    return ImageResult(
+        prediction=label,
+        confidence=round(confidence * 100, 2),
+        probability=p,
+        thumbnail=thumbnail
+    )
+
+
+def predict_batch(images, threshold=THRESHOLD, thumbnails=None):
+    """
+    images: list of NumPy arrays, each (224, 224, 3)
+    thumbnails: optional JPEG bytes per image, carried into the results
+    Any number of images is accepted; they are split into
+    MAX_BATCH_SIZE chunks and results are returned in input order.
+    The input arrays are not kept in the results.
+    """
+    if thumbnails is None:
+        thumbnails = [None] * len(images)
+
+    results = []
+    for start in range(0, len(images), MAX_BATCH_SIZE):
+        chunk = images[start:start + MAX_BATCH_SIZE]
+        probs = run_session(chunk)
+        results.extend(
+            to_result(prob, thumbnail, threshold)
+            for prob, thumbnail in zip(probs, thumbnails[start:start + MAX_BATCH_SIZE])
+        )
     return results
+
+
+class InferenceBatcher:
+    """
+    Collects images one at a time and runs them through ONNX in batches
+    of up to MAX_BATCH_SIZE. A batch is flushed when it is full or, if
+    max_wait_ms is set, when its oldest image has waited that long.
+
+    Results are returned in the order images were added.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS, threshold=THRESHOLD):
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+        self.max_wait = max_wait_ms / 1000
+        self.threshold = threshold
+        self._pending = []
+        self._thumbnails = []
+        self._oldest = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def deadline_passed(self) -> bool:
+        return (
+            self.max_wait > 0
+            and self._oldest is not None
+            and time.monotonic() - self._oldest >= self.max_wait
+        )
+
+    def add(self, image, thumbnail=None):
+        """
+        Queues an image. Returns the results of any batch this flushed
+        (an empty list when the batch is still filling).
+        """
+        if not self._pending:
+            self._oldest = time.monotonic()
+        self._pending.append(image)
+        self._thumbnails.append(thumbnail)
+
+        if len(self._pending) >= self.max_batch_size or self.deadline_passed():
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Runs whatever is pending, full batch or not.
+        """
+        if not self._pending:
+            return []
+
+        images, thumbnails = self._pending, self._thumbnails
+        self._pending = []
+        self._thumbnails = []
+        self._oldest = None
+
+        return predict_batch(images, threshold=self.threshold, thumbnails=thumbnails)
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+
+from cachetools import LRUCache
+from pymongo import UpdateOne
+
+from job_storage.mongo_init import prediction_cache_collection
+from workers.prediction import model_version
+
+# ---------- CONFIG ----------
+# Entries kept in the in-process LRU tier
+CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+
+# Set to "0" to skip the Mongo tier and cache in-process only
+PERSISTENT_CACHE = os.getenv("PREDICTION_CACHE_PERSISTENT", "1") == "1"
+
+_memory = LRUCache(maxsize=CACHE_SIZE)
+_lock = threading.Lock()
+
+_stats = {
+    "memory_hits": 0,
+    "persistent_hits": 0,
+    "misses": 0,
+}
+
+
+def cache_key(image_bytes: bytes) -> str:
+    """
+    SHA-256 of the raw uploaded bytes, scoped to the loaded model.
+    """
+    return f"{hashlib.sha256(image_bytes).hexdigest()}:{model_version()}"
+
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory)
+
+    lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+    stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+    return stats
+
+
+async def lookup(key: str) -> Optional[float]:
+    """
+    Returns the cached probability for key, or None on a miss.
+    """
+    with _lock:
+        prob = _memory.get(key)
+        if prob is not None:
+            _stats["memory_hits"] += 1
+            return prob
+
+    if PERSISTENT_CACHE:
+        try:
+            doc = await prediction_cache_collection.find_one(
+                {"_id": key},
+                {"probability": 1}
+            )
+        except Exception as e:
+            # The cache must never fail a job
+            print(f"⚠️ Prediction cache lookup failed: {e}")
+            doc = None
+
+        if doc is not None:
+            with _lock:
+                _memory[key] = doc["probability"]
+                _stats["persistent_hits"] += 1
+            return doc["probability"]
+
+    with _lock:
+        _stats["misses"] += 1
+    return None
+
+
+async def store_many(entries: Iterable[Tuple[str, float]]) -> None:
+    """
+    entries: (cache key, probability) pairs for freshly inferred images
+    """
+    entries = list(entries)
+    if not entries:
+        return
+
+    with _lock:
+        for key, prob in entries:
+            _memory[key] = prob
+
+    if not PERSISTENT_CACHE:
+        return
+
+    now = datetime.now(timezone.utc)
+    try:
+        await prediction_cache_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": key},
+                    {"$set": {
+                        "probability": prob,
+                        "model_version": model_version(),
+                        "created_at": now
+                    }},
+                    upsert=True
+                )
+                for key, prob in entries
+            ],
+            ordered=False
+        )
+    except Exception as e:
+        print(f"⚠️ Prediction cache write failed: {e}")
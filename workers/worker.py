@@ -1,16 +1,23 @@
 import json
+import os
+import socket
 import traceback
 import signal
 import sys
-from workers import email_worker, image_prep, pdf_creator, prediction
-from supabase_client.supabase_init import supabase_admin
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, ReturnDocument
+from workers import email_worker, pdf_creator, pipeline, prediction, prediction_cache, profiling
+from supabase_client.supabase_init import get_async_admin
 from supabase_client.storage_operations import (
     delete_images_create_report,
     create_signed_report_url
 )
 import asyncio
 from supabase_client.db_operations import update_job_status
-from job_storage.mongo_init import jobs_collection
+from job_storage.mongo_init import jobs_collection, ensure_indexes
+from job_storage import email_outbox, job_checkpoints, job_scheduler, job_signals
+import metrics
 
 # =========================
 # Graceful Shutdown
@@ -22,22 +29,102 @@ def shutdown_handler(sig=None, frame=None):
     loop.call_soon_threadsafe(shutdown_event.set)
 
 
+def install_signal_handlers():
+    # Standalone process only: inside the API (/internal/run-worker) the
+    # server keeps its own SIGINT / SIGTERM handling
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
 
-signal.signal(signal.SIGINT, shutdown_handler)
-signal.signal(signal.SIGTERM, shutdown_handler)
 
 
+# =========================
+# Job Leases
+# =========================
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# A claimed job belongs to this worker until lease_until; the heartbeat
+# keeps pushing it forward while the job runs. If the worker dies the
+# lease expires and another worker re-claims the job.
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "120"))
+HEARTBEAT_SECONDS = LEASE_SECONDS / 3
+
+
+def _lease_expiry():
+    return datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)
+
 
 async def fetch_next_job():
+    """
+    Atomically claims the unclaimed (or lease-expired) job with the
+    smallest schedule_key: per-user fair, small jobs first, aged so
+    nothing starves (see job_storage.job_scheduler). Jobs queued before
+    scheduling existed have no key and go first.
+    """
     job = await jobs_collection.find_one_and_update(
-        {},                         # pick any job
-        {"$inc": {"retry_count": 1}},
-        return_document=True
+        {"$or": [
+            {"lease_until": None},
+            {"lease_until": {"$lt": datetime.now(timezone.utc)}}
+        ]},
+        {
+            "$set": {"worker_id": WORKER_ID, "lease_until": _lease_expiry()},
+            "$inc": {"retry_count": 1}
+        },
+        sort=[("schedule_key", ASCENDING), ("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
     )
     return job
 
-async def handle_success(job):
-    await jobs_collection.delete_one({"_id": job["_id"]})
+
+async def heartbeat(job, job_task: asyncio.Task, lease_lost: asyncio.Event):
+    """
+    Extends the lease on job until cancelled. If the lease has been lost
+    (re-claimed by another worker, or expired because renewals kept
+    failing), sets lease_lost and cancels job_task so this worker stops
+    working on the job.
+    """
+    # Lease claimed just before the heartbeat started
+    lease_deadline = time.monotonic() + LEASE_SECONDS
+
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+
+        renewed_at = time.monotonic()
+        try:
+            result = await jobs_collection.update_one(
+                {"_id": job["_id"], "worker_id": WORKER_ID},
+                {"$set": {"lease_until": _lease_expiry()}}
+            )
+        except Exception as e:
+            # Transient (reconnect, timeout): try again on the next tick
+            # while the current lease still holds
+            print(f"⚠️ Lease renewal failed for job {job['job_id']}: {str(e)}")
+            if time.monotonic() < lease_deadline:
+                continue
+            result = None
+
+        if result is None or result.matched_count == 0:
+            print(f"⚠️ Lost lease on job {job['job_id']}")
+            lease_lost.set()
+            job_task.cancel()
+            return
+
+        lease_deadline = renewed_at + LEASE_SECONDS
+
+
+async def release_job(job):
+    """
+    Gives up the lease so the job can be retried by any worker.
+    """
+    await jobs_collection.update_one(
+        {"_id": job["_id"], "worker_id": WORKER_ID},
+        {"$set": {"lease_until": None, "worker_id": None}}
+    )
+
+
+async def handle_success(job, email: dict):
+    # Removing the job and queueing its email happen together
+    await email_outbox.complete_job(job, WORKER_ID, email)
+    await job_checkpoints.clear_results(job["job_id"])
     # Update SQL → DONE
 
 
@@ -46,135 +133,286 @@ MAX_RETRIES = 5
 
 async def handle_failure(job):
     if job["retry_count"] >= MAX_RETRIES:
-        await jobs_collection.delete_one({"_id": job["_id"]})
+        await jobs_collection.delete_one({"_id": job["_id"], "worker_id": WORKER_ID})
+        await job_checkpoints.clear_results(job["job_id"])
         # Update SQL → FAILED
+    else:
+        await release_job(job)
 
 
 # =========================
-# Worker Function
+# Idle Policy
 # =========================
-async def run_worker():
+# "wait": long-lived daemon that sleeps until a job arrives
+# "exit": stop once no job has arrived for WORKER_MAX_IDLE_SECONDS
+IDLE_POLICY = os.getenv("WORKER_IDLE_POLICY", "wait")
+MAX_IDLE_SECONDS = float(os.getenv("WORKER_MAX_IDLE_SECONDS", "60"))
 
+# Fallback polling when no enqueue signal arrives: doubles from min to max
+POLL_MIN_SECONDS = float(os.getenv("WORKER_POLL_MIN_SECONDS", "0.5"))
+POLL_MAX_SECONDS = float(os.getenv("WORKER_POLL_MAX_SECONDS", "30"))
 
-    MAX_IDLE_RETRIES = 5
-    idle_retries = 0
+# Run the email outbox sender inside the worker. Off by default: the rate
+# limit is per process, so run one `python -m workers.email_worker` instead
+# of a sender in every worker replica
+EMAIL_SENDER_IN_WORKER = os.getenv("WORKER_EMAIL_SENDER", "0") == "1"
 
-    print("🚀 Worker started")
-    print("🧠 Press Ctrl+C to stop safely\n")
 
-    while not shutdown_event.is_set():
-        try:
-            print("⏳ Waiting for next job...")
-            task_json = await fetch_next_job()
+async def wait_for_work(timeout: float) -> bool:
+    """
+    Sleeps until a job is signalled, shutdown is requested or timeout passes.
+    Returns True if woken early.
+    """
+    waiters = [
+        asyncio.ensure_future(job_signals.wait_for_job(timeout)),
+        asyncio.ensure_future(shutdown_event.wait()),
+    ]
+    done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
 
-            if not task_json:
-                idle_retries += 1
-                print(f"🫀 Worker alive, no jobs yet ({idle_retries}/{MAX_IDLE_RETRIES})")
+    for waiter in pending:
+        waiter.cancel()
 
-                if idle_retries >= MAX_IDLE_RETRIES:
-                    shutdown_handler()
-                    return 
+    return waiters[1] in done or waiters[0].result()
 
-                continue
 
-            idle_retries = 0
+def _observe_queue_wait(job):
+    # First pickup only; retries would count the failed attempts as waiting
+    if job.get("retry_count") != 1 or not job.get("created_at"):
+        return
 
-            task = task_json
-            job_id = task["job_id"]
+    try:
+        created_at = datetime.fromisoformat(job["created_at"])
+    except (TypeError, ValueError):
+        return
 
-            print(f"\n🔄 Picked up job: {job_id}")
-
-            try:
-                print("🟡 Updating job status → PROGRESSED")
-                update_job_status(job_id=job_id, status="PROGRESSED")
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
 
-                bucket = task["bucket"]
-                input_prefix = task["input_prefix"]
-                manifest_path = task["manifest_path"]
-                report_prefix = task["report_prefix"]
-                report_filename = task["report_filename"]
+    metrics.JOB_QUEUE_WAIT.labels(lane=job.get("lane", job_scheduler.STANDARD)).observe(
+        (datetime.now(timezone.utc) - created_at).total_seconds()
+    )
 
-                results = []
-                batch_images = []
 
-                manifest_bytes = (
+async def process_job(task):
+    """
+    Runs one claimed job to the end: DONE, or back to the queue / FAILED
+    on error. Cancelled by the heartbeat if the lease is lost.
+    """
+    job_id = task["job_id"]
+
+    try:
+        print("🟡 Updating job status → PROGRESSED")
+        await update_job_status(job_id=job_id, status="PROGRESSED")
+
+        bucket = task["bucket"]
+        input_prefix = task["input_prefix"]
+        manifest_path = task["manifest_path"]
+        report_prefix = task["report_prefix"]
+        report_filename = task["report_filename"]
+
+        # Stages already finished by an earlier attempt are skipped
+        if job_checkpoints.stage_done(task, job_checkpoints.REPORT_UPLOADED):
+            report_path = task["checkpoint"]["report_path"]
+            print("⏭️ Report already uploaded, skipping prediction")
+        else:
+            supabase_admin = await get_async_admin()
+            with metrics.stage("manifest_fetch").time():
+                manifest_bytes = await (
                     supabase_admin.storage
                     .from_(bucket)
                     .download(manifest_path)
                 )
 
-                manifest = json.loads(manifest_bytes.decode("utf-8"))
+            manifest = json.loads(manifest_bytes.decode("utf-8"))
+            filenames = manifest["images"]
 
-                for filename in manifest["images"]:
-                    processed_img = image_prep.load_image(
-                        bucket_name=bucket,
-                        file_path=f"{input_prefix}{filename}"
-                    )
+            done = await job_checkpoints.load_results(job_id, len(filenames))
+            resumed = sum(r is not None for r in done)
+            if resumed:
+                print(f"⏭️ Resuming with {resumed}/{len(filenames)} images already predicted")
 
-                    batch_images.append(processed_img)
+            if job_checkpoints.stage_done(task, job_checkpoints.PREDICTED) and resumed == len(filenames):
+                results = done
+            else:
+                predicted = resumed
 
-                    if len(batch_images) == 2:
-                        results.extend(prediction.predict_batch(batch_images))
-                        batch_images.clear()
+                async def on_results(entries):
+                    nonlocal predicted
+                    await job_checkpoints.save_results(job_id, entries)
+                    predicted += len(entries)
+                    await job_signals.notify_job_progress(job_id, predicted, len(filenames))
 
-                if batch_images:
-                    results.extend(prediction.predict_batch(batch_images))
-
-                pdf_creator.create_pdf_report(
-                    results=results,
-                    output_path=report_filename
+                results = await pipeline.run_image_pipeline(
+                    bucket=bucket,
+                    input_prefix=input_prefix,
+                    filenames=filenames,
+                    done=done,
+                    on_results=on_results
                 )
+                await job_checkpoints.mark_stage(task, job_checkpoints.PREDICTED)
+                print(f"📦 Prediction cache: {prediction_cache.cache_stats()}")
+
+            with metrics.stage("pdf_render").time():
+                report_bytes = await pdf_creator.render_pdf_report(results)
 
-                report_path = delete_images_create_report(
+            with metrics.stage("report_upload").time():
+                report_path = await delete_images_create_report(
                     bucket=bucket,
                     input_prefix=input_prefix,
                     report_prefix=report_prefix,
-                    report_filename=report_filename
+                    report_filename=report_filename,
+                    report_bytes=report_bytes
                 )
+            await job_checkpoints.mark_stage(
+                task,
+                job_checkpoints.REPORT_UPLOADED,
+                report_path=report_path
+            )
+
+        with metrics.stage("signed_url").time():
+            signed_url = await create_signed_report_url(
+                bucket=bucket,
+                report_path=report_path
+            )
+
+        print("🟢 Updating job status → DONE")
+        await update_job_status(
+            job_id=job_id,
+            status="DONE",
+            report_path=report_path
+        )
+
+        # Sent later by the email sender; delivery no longer blocks the job
+        await handle_success(task, email_worker.report_email(
+            user_email=task["user_email"],
+            user_id=task["user_id"],
+            report_link=signed_url
+        ))
+
+        # r.lrem(PROCESSING_QUEUE, 1, task_json)
+        metrics.JOBS_TOTAL.labels(outcome="done").inc()
+        print(f"✅ Job {job_id} completed")
+
+    except Exception:
+        print(f"❌ Job {job_id} failed")
+        print(traceback.format_exc())
+
+        if task["retry_count"] >= MAX_RETRIES:
+            await update_job_status(job_id=job_id, status="FAILED")
+            await handle_failure(task)
+            metrics.JOBS_TOTAL.labels(outcome="failed").inc()
+            print(f"⛔ Job {job_id} permanently failed")
+        else:
+            # Retry will happen later
+            await update_job_status(job_id=job_id, status="QUEUED")
+            await handle_failure(task)
+            metrics.JOBS_TOTAL.labels(outcome="retried").inc()
+            print(
+            f"🔁 Job {job_id} failed, retrying "
+            f"({task['retry_count']}/{MAX_RETRIES})"
+            )
 
-                signed_url = create_signed_report_url(
-                    bucket=bucket,
-                    report_path=report_path
-                )
 
-                print("🟢 Updating job status → DONE")
-                update_job_status(
-                    job_id=job_id,
-                    status="DONE",
-                    report_path=report_path
-                )
+# =========================
+# Worker Function
+# =========================
+async def run_worker(idle_policy: str = IDLE_POLICY):
 
-                email_worker.send_report_email(
-                    user_email=task["user_email"],
-                    user_id=task["user_id"],
-                    report_link=signed_url
-                )
-                await handle_success(task_json)
-
-                # r.lrem(PROCESSING_QUEUE, 1, task_json)
-                print(f"✅ Job {job_id} completed")
-
-            except Exception:
-                print(f"❌ Job {job_id} failed")
-                print(traceback.format_exc())
-                
-
-                if task["retry_count"] >= MAX_RETRIES:
-                    update_job_status(job_id=job_id, status="FAILED")
-                    await handle_failure(task)
-                    print(f"⛔ Job {job_id} permanently failed")
-                else:
-                    # Retry will happen later
-                    update_job_status(job_id=job_id, status="QUEUED")
-                    print(
-                    f"🔁 Job {job_id} failed, retrying "
-                    f"({task['retry_count']}/{MAX_RETRIES})"
-                    )
+    await ensure_indexes()
+    # Fail fast on a missing / broken model, before any job is claimed
+    await asyncio.to_thread(prediction.load_model)
+    tailer = job_signals.start_tailer()
+    sender = asyncio.create_task(email_worker.run_email_sender()) if EMAIL_SENDER_IN_WORKER else None
+
+    print(f"🚀 Worker {WORKER_ID} started")
+    print("🧠 Press Ctrl+C to stop safely\n")
+
+    try:
+        await _worker_loop(idle_policy)
+
+        if sender and idle_policy == "exit":
+            # Short-lived run: deliver what this run queued before stopping
+            await email_worker.send_pending()
+    finally:
+        if tailer:
+            tailer.cancel()
+        if sender:
+            sender.cancel()
+
+
+async def _worker_loop(idle_policy: str):
+    poll_delay = POLL_MIN_SECONDS
+    idle_since = None
+
+    while not shutdown_event.is_set():
+        try:
+            task_json = await fetch_next_job()
+
+            if not task_json:
+                if idle_since is None:
+                    idle_since = time.monotonic()
+                    print("⏳ Waiting for next job...")
+
+                idle_for = time.monotonic() - idle_since
+                if idle_policy == "exit" and idle_for >= MAX_IDLE_SECONDS:
+                    print(f"💤 No jobs for {idle_for:.1f}s, stopping worker")
+                    return
+
+                timeout = poll_delay
+                if idle_policy == "exit":
+                    timeout = min(timeout, MAX_IDLE_SECONDS - idle_for)
+
+                woken = await wait_for_work(timeout)
+                poll_delay = POLL_MIN_SECONDS if woken else min(poll_delay * 2, POLL_MAX_SECONDS)
+                continue
+
+            idle_since = None
+            poll_delay = POLL_MIN_SECONDS
+
+            task = task_json
+            job_id = task["job_id"]
+
+            print(f"\n🔄 Picked up job: {job_id}")
+            _observe_queue_wait(task)
+
+            lease_lost = asyncio.Event()
+            job = asyncio.create_task(process_job(task))
+            lease = asyncio.create_task(heartbeat(task, job, lease_lost))
+            # None unless this job was picked for profiling
+            profiler = profiling.start_for_job(task)
+
+            try:
+                await job
+            except asyncio.CancelledError:
+                if not lease_lost.is_set():
+                    raise
+                # Another worker owns the job now; its status, retries and
+                # checkpoints are left to that worker
+                metrics.JOBS_TOTAL.labels(outcome="lease_lost").inc()
+                print(f"🛑 Job {job_id} aborted: lease lost")
+
+            finally:
+                lease.cancel()
+                if profiler:
+                    await profiling.finish(profiler, task)
 
         except KeyboardInterrupt:
             shutdown_handler()
 
+        except Exception:
+            # Transient Mongo / Supabase errors must not stop the daemon
+            print(f"❌ Worker loop error, retrying in {poll_delay:.1f}s")
+            print(traceback.format_exc())
+
+            try:
+                await asyncio.wait_for(shutdown_event.wait(), poll_delay)
+            except asyncio.TimeoutError:
+                pass
+            poll_delay = min(poll_delay * 2, POLL_MAX_SECONDS)
+
 
 if __name__ == "__main__":
     import asyncio
+    install_signal_handlers()
+    metrics.start_worker_metrics_server()
     asyncio.run(run_worker())